@@ -7,6 +7,14 @@ from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 from point_set import *
 from range_trees.rangetree import *
+from range_trees.instrumentation import collect_stats
+from range_trees.cache import QueryCache
+from range_trees.service import RangeTreeService
+from range_trees.index import INDEXES, RangeTreeIndex, build_index
+from range_trees.builder import BudgetExceeded, BuildCancelled, TreeBuilder
+from range_trees.paging import RangePager
+from concurrent.futures import TimeoutError
+import math
 import time
 
 
@@ -69,7 +77,113 @@ data=[
 
 GITHUB_LINK = "https://github.com/6851-2021/range-trees-visualization"
 
-tree = TreeNode.create_from_points([(0,0,0)])
+QUERY_TIMEOUT = 10
+AUTO = "Auto"
+# At most this many points are sent to the browser; larger sets are shown as an even sample.
+POINT_BUDGET = 5000
+INSIDE_COLOR = "#f4d44d"
+OUTSIDE_COLOR = "#1f77b4"
+# Bytes a tree may take, e.g. BUILD_MEMORY_BUDGET=1073741824; half of the free memory by default.
+BUILD_MEMORY_BUDGET = int(os.environ["BUILD_MEMORY_BUDGET"]) if "BUILD_MEMORY_BUDGET" in os.environ else None
+BUILD_POLL_MS = 500
+
+points = [(0,0,0)]
+# The snapshot version whose sample the browser shows, that sample, and the positions of each
+# point's copies in it to address their marker colors; replaced together in one assignment.
+current_sample = (None, None, None)
+query_cache = QueryCache()
+service = RangeTreeService(RangeTreeIndex.build(points), build=build_index)
+# The builder and engine of the latest rebuild, polled for its progress, and why the last one failed.
+builder = None
+requested_index = RangeTreeIndex
+build_error = None
+
+
+def sample_of(tree, version):
+    """The sample of ``tree`` shown in the browser and the positions of its points' copies.
+
+    The sample depends only on the tree, so every session shows the same one for a version,
+    and it is computed once per version.
+    """
+    global current_sample
+    cached = current_sample
+    if cached[0] != version:
+        everywhere = (-math.inf,) * 3, (math.inf,) * 3
+        pager = RangePager(tree, *everywhere)
+        sample = pager.sample(POINT_BUDGET)
+        positions = {}
+        for i, point in enumerate(sample.tolist()):
+            positions.setdefault(tuple(point), []).append(i)
+        data = {"x": sample[:, 0].tolist(), "y": sample[:, 1].tolist(), "z": sample[:, 2].tolist(),
+                "total": pager.total, "version": version}
+        cached = current_sample = version, data, positions
+    return cached[1], cached[2]
+
+
+def point_sample(tree, version):
+    return sample_of(tree, version)[0]
+
+
+def box_diff(tree, version, shown, previous, start, end):
+    """The sample positions of the points that entered and left the box since ``previous``.
+
+    Without a previous box of the same tree version, every point inside the box has entered.
+    Copies of a point are always on the same side of a box, so they enter and leave together
+    and every one of their markers is recolored. Returns ``None`` while the browser shows the
+    sample of another version than ``version`` (``shown``), whose positions would not match.
+    """
+    if shown != version:
+        return None
+    positions = sample_of(tree, version)[1]
+    if previous is None or previous["to"][0] != version:
+        old = (math.inf,) * 3, (-math.inf,) * 3
+        changed_from = None
+    else:
+        changed_from = previous["to"]
+        old = tuple(changed_from[1]), tuple(changed_from[2])
+    entered, left = tree.diff(*old, start, end)
+    return {
+        "from": changed_from,
+        "to": [version, list(start), list(end)],
+        "entered": [i for p in set(map(tuple, entered)) for i in positions.get(p, ())],
+        "left": [i for p in set(map(tuple, left)) for i in positions.get(p, ())],
+    }
+
+
+def index_builder(name):
+    return TreeBuilder(None if name == AUTO else name, memory_budget=BUILD_MEMORY_BUDGET)
+
+
+def start_rebuild(new_points, build, index):
+    """Rebuild the shared tree over ``new_points`` with ``build``, whose progress the page then shows."""
+    global builder, requested_index, build_error
+    builder, requested_index, build_error = build, index, None
+    future = service.rebuild(new_points, build=build)
+    future.add_done_callback(lambda future: finish_rebuild(future, new_points))
+    return future
+
+
+def finish_rebuild(future, new_points):
+    """Adopt ``new_points`` once their tree is in the snapshot, or record why it is not."""
+    global points, requested_index, build_error
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is None:
+        points = new_points
+    elif isinstance(error, BuildCancelled):
+        requested_index = type(service.snapshot[0])
+        build_error = "Build cancelled; still showing the previous points."
+    else:
+        requested_index = type(service.snapshot[0])
+        build_error = "Build failed: " + str(error)
+
+
+def count_with_stats(tree, version, start, end):
+    with collect_stats() as stats:
+        count = query_cache.count(tree, start, end, version=version)
+    return count, stats
+
 
 app.layout = html.Div(
     [
@@ -136,7 +250,9 @@ app.layout = html.Div(
                         html.P("Select option", className="subheader"),
                         dcc.RadioItems(
                             options=[
-                                {"label": "Regular Range Tree", "value": "Regular"},
+                                {"label": index.label, "value": name} for name, index in INDEXES.items()
+                            ] + [
+                                {"label": "Automatic (by size and available memory)", "value": AUTO},
                             ],
                             id="radio-options",
                             labelClassName="label__option",
@@ -154,6 +270,9 @@ app.layout = html.Div(
                         html.Br(),
                         html.Br(),
                         html.Button("Generate", id='generate', n_clicks=0),
+                        html.Button("Cancel", id='cancel-build', n_clicks=0),
+                        html.Div(id="build-progress"),
+                        dcc.Interval(id="build-poll", interval=BUILD_POLL_MS),
                     ],
                     className="pb-20",
                 ),
@@ -193,6 +312,9 @@ app.layout = html.Div(
             className="one-third column app__right__section",
         ),
         dcc.Store(id="annotation_storage"),
+        dcc.Store(id="point-sample", data=point_sample(*service.snapshot)),
+        dcc.Store(id="highlight"),
+        dcc.Store(id="build-request"),
     ]
 )
 
@@ -204,80 +326,182 @@ app.layout = html.Div(
      dash.dependencies.State('z', 'value'),]
 )
 def query(n, x,y,z):
-    start = PointIndex((x[0], y[0], z[0]))
-    end = PointIndex((x[1], y[1], z[1]))
+    start = (x[0], y[0], z[0])
+    end = (x[1], y[1], z[1])
     start_time = time.time()
-    top_nodes = list(tree.range_query(start, end))
-    actual_count = sum([st.size for st in top_nodes])
+    future = service.submit(lambda tree, version: count_with_stats(tree, version, start, end))
+    try:
+        actual_count, stats = future.result(QUERY_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        return "Query timed out after " + str(QUERY_TIMEOUT) + " seconds"
     end_time = time.time()
-    return str(actual_count) +  " elements in range " + \
-           str(x) + ', ' + str(y) + ', ' + str(z) + ' in time: ' + str(end_time - start_time)
+    answer = [
+        html.Div(str(actual_count) + " elements in range " +
+                 str(x) + ', ' + str(y) + ', ' + str(z) + ' in time: ' + str(end_time - start_time)),
+        html.Div("Answered by: " + type(service.snapshot[0]).label),
+        html.Div("Breakdown: " + stats.summary()),
+    ]
+    if service.building:
+        answer.append(html.Div("The tree is being rebuilt; this answer is from the previous points."))
+    return answer
 
 @app.callback(
     dash.dependencies.Output('tree-type', 'children'),
     [dash.dependencies.Input('radio-options', 'value')]
 )
 def update_tree(tree_type):
-    return "Currently selected: " + tree_type + " Range Tree"
+    build = index_builder(tree_type)
+    try:
+        plan = build.plan(len(points), 3)
+    except BudgetExceeded as error:
+        return "Not rebuilt: " + str(error)
+    # Every page load fires this callback too; only a change of engine rebuilds the shared tree,
+    # so a new session neither repeats nor cancels the build of another one.
+    if plan.index is not requested_index:
+        start_rebuild(points, build, plan.index)
+    if tree_type == AUTO:
+        return "Currently selected: " + plan.index.label + " (automatic)"
+    if plan.index is not INDEXES[tree_type]:
+        return ("Currently selected: " + plan.index.label + " (" + INDEXES[tree_type].label +
+                " would not fit in memory)")
+    return "Currently selected: " + INDEXES[tree_type].label
 
 @app.callback(
-    dash.dependencies.Output('points', 'figure'),
+    dash.dependencies.Output('build-request', 'data'),
+    [dash.dependencies.Input('generate', 'n_clicks')],
+    [dash.dependencies.State('num_elements', 'value'),
+     dash.dependencies.State('radio-options', 'value')]
+)
+def generate(n, num_points, tree_type):
+    global build_error
+    if not n:
+        raise PreventUpdate
+    if (num_points == None): num_points = 10
+    build = index_builder(tree_type)
+    # Refuse before generating anything, so a mistyped size cannot run the server out of memory.
+    try:
+        plan = build.plan(num_points, 3)
+    except BudgetExceeded as error:
+        build_error = "Not generated: " + str(error)
+        raise PreventUpdate
+    xs, ys, zs = generate_random_points(num_points, np.sqrt(num_points))
+    new_points = list(zip(xs.tolist(), ys.tolist(), zs.tolist()))
+    # Return right away: the request thread stays free for the progress poll, the Cancel
+    # button and queries, and the poll publishes the new points once the tree is swapped in.
+    start_rebuild(new_points, build, plan.index)
+    return n
+
+@app.callback(
+    dash.dependencies.Output('build-progress', 'children'),
+    dash.dependencies.Output('point-sample', 'data'),
     dash.dependencies.Output('x', 'min'),
     dash.dependencies.Output('y', 'min'),
     dash.dependencies.Output('z', 'min'),
     dash.dependencies.Output('x', 'max'),
     dash.dependencies.Output('y', 'max'),
     dash.dependencies.Output('z', 'max'),
-    dash.dependencies.Output('range', 'children'),
-    [dash.dependencies.Input('generate', 'n_clicks'),
+    [dash.dependencies.Input('build-poll', 'n_intervals'),
+     dash.dependencies.Input('build-request', 'data')],
+    [dash.dependencies.State('point-sample', 'data')]
+)
+def build_progress(n, request, shown):
+    if build_error is not None:
+        status = build_error
+    else:
+        progress = builder.progress if builder is not None else None
+        status = progress.summary() if progress is not None else ""
+    # Every session shows the sample of the current snapshot, whichever session rebuilt it.
+    if service.building or (shown is not None and shown.get("version") == service.snapshot[1]):
+        return [status] + [dash.no_update] * 7
+    try:
+        sample = service.submit(point_sample).result(QUERY_TIMEOUT)
+    except TimeoutError:
+        return [status] + [dash.no_update] * 7
+    maxR = np.floor(np.sqrt(sample["total"]))
+    minR = -maxR
+    return status, sample, minR, minR, minR, maxR, maxR, maxR
+
+@app.callback(
+    dash.dependencies.Output('placeholder', 'children'),
+    [dash.dependencies.Input('cancel-build', 'n_clicks')]
+)
+def cancel_build(n):
+    if not n or builder is None:
+        raise PreventUpdate
+    builder.cancel()
+    return ""
+
+@app.callback(
+    dash.dependencies.Output('highlight', 'data'),
+    [dash.dependencies.Input('point-sample', 'data'),
      dash.dependencies.Input('x', 'value'),
      dash.dependencies.Input('y', 'value'),
      dash.dependencies.Input('z', 'value')],
-    [dash.dependencies.State('num_elements', 'value'),
-     dash.dependencies.State('x', 'min'),
-     dash.dependencies.State('y', 'min'),
-     dash.dependencies.State('z', 'min'),
-     dash.dependencies.State('x', 'max'),
-     dash.dependencies.State('y', 'max'),
-     dash.dependencies.State('z', 'max')]
+    [dash.dependencies.State('highlight', 'data')]
 )
-def update_points(n, x, y, z, num_points, xmin, ymin, zmin, xmax, ymax, zmax):
-    global tree
-    global data
+def highlight(sample, x, y, z, previous):
     ctx = dash.callback_context
-    range_string = 'Range: ' + str(x) + ', ' + str(y) + ', ' + str(z)
-
-    if ctx.triggered:
-        input_id = ctx.triggered[0]['prop_id'].split('.')[0]
-        if input_id == 'generate':
-            if (num_points == None): num_points = 10
-            xs, ys, zs = generate_random_points(num_points, np.sqrt(num_points))
-            data[1]['x'] = xs
-            data[1]['y'] = ys
-            data[1]['z'] = zs
-
-            tree = TreeNode.create_from_points(list(zip(xs, ys, zs)))
-
-            minR = -np.floor(np.sqrt(num_points))
-            maxR = np.floor(np.sqrt(num_points))
-
-            return { "data": data, "layout": plot_layout}, minR, minR, minR, maxR, maxR, maxR, range_string
-        else:
-            xs = [x[0] if np.floor(i / 2) % 2 == 0 else x[1] for i in range(8)]
-            ys = [y[0] if np.floor((i - 1) / 2) % 2 == 0 else y[1] for i in range(8)]
-            zs = [z[0] if np.floor(i / 4) % 2 == 0 else z[1] for i in range(8)]
-
-            data[0]['x'] = xs
-            data[0]['y'] = ys
-            data[0]['z'] = zs
-
-            return {"data": data, "layout": plot_layout}, xmin, ymin, zmin, xmax, ymax, zmax, range_string
-
-
-
-    return { "data": data, "layout": plot_layout}, xmin, ymin, zmin, xmax, ymax, zmax, range_string
-
+    if ctx.triggered and ctx.triggered[0]['prop_id'] == 'point-sample.data':
+        previous = None
+    start = (x[0], y[0], z[0])
+    end = (x[1], y[1], z[1])
+    shown = sample["version"] if sample is not None else None
+    future = service.submit(lambda tree, version: box_diff(tree, version, shown, previous, start, end))
+    try:
+        diff = future.result(QUERY_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        raise PreventUpdate
+    if diff is None:
+        # The poll publishes the new snapshot's sample, which triggers this again.
+        raise PreventUpdate
+    return diff
 
+# Moving a slider only changes the box mesh, so the figure is rebuilt in the browser from the
+# stored sample and no point data goes over the wire. Points inside the box are recolored from
+# the entered/left positions of the highlight diff, which is applied only on top of the box it
+# was computed from (kept in the trace's meta), so a diff that arrives out of order is dropped.
+app.clientside_callback(
+    """
+    function(sample, x, y, z, highlight, figure) {
+        var triggered = dash_clientside.callback_context.triggered.map(function(t) { return t.prop_id; });
+        var previous = figure.data[1];
+        var corners = [0, 1, 2, 3, 4, 5, 6, 7];
+        var mesh = Object.assign({}, figure.data[0], {
+            x: corners.map(function(i) { return Math.floor(i / 2) % 2 === 0 ? x[0] : x[1]; }),
+            y: corners.map(function(i) { return Math.floor((i - 1) / 2) % 2 === 0 ? y[0] : y[1]; }),
+            z: corners.map(function(i) { return Math.floor(i / 4) % 2 === 0 ? z[0] : z[1]; })
+        });
+        var reset = triggered.indexOf('point-sample.data') >= 0 || !previous.marker ||
+            !Array.isArray(previous.marker.color) || previous.marker.color.length !== sample.x.length;
+        var colors = reset ? sample.x.map(function() { return OUTSIDE_COLOR; }) : previous.marker.color.slice();
+        var meta = reset ? null : previous.meta;
+        if (highlight && triggered.indexOf('highlight.data') >= 0 &&
+                (highlight.from === null || JSON.stringify(highlight.from) === JSON.stringify(meta))) {
+            if (highlight.from === null) {
+                colors = sample.x.map(function() { return OUTSIDE_COLOR; });
+            }
+            highlight.entered.forEach(function(i) { colors[i] = INSIDE_COLOR; });
+            highlight.left.forEach(function(i) { colors[i] = OUTSIDE_COLOR; });
+            meta = highlight.to;
+        }
+        var marker = Object.assign({}, previous.marker, {color: colors});
+        var scatter = Object.assign({}, previous, {x: sample.x, y: sample.y, z: sample.z, marker: marker, meta: meta});
+        var range = 'Range: ' + JSON.stringify(x) + ', ' + JSON.stringify(y) + ', ' + JSON.stringify(z) +
+            '; showing ' + sample.x.length + ' of ' + sample.total + ' points';
+        return [{data: [mesh, scatter], layout: figure.layout}, range];
+    }
+    """.replace("INSIDE_COLOR", repr(INSIDE_COLOR)).replace("OUTSIDE_COLOR", repr(OUTSIDE_COLOR)),
+    dash.dependencies.Output('points', 'figure'),
+    dash.dependencies.Output('range', 'children'),
+    [dash.dependencies.Input('point-sample', 'data'),
+     dash.dependencies.Input('x', 'value'),
+     dash.dependencies.Input('y', 'value'),
+     dash.dependencies.Input('z', 'value'),
+     dash.dependencies.Input('highlight', 'data')],
+    [dash.dependencies.State('points', 'figure')]
+)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+"""Benchmarks for the range tree engines.
+
+Measures build time, peak build memory and query latency percentiles over point sets from
+``point_set.generate_random_points``, and writes the results as JSON::
+
+    python benchmark.py --sizes 1000 10000 --dimensions 2 3 --output results.json
+
+Cases whose estimated index size is over ``--memory-budget`` are skipped. Every build and
+query runs once untimed to warm up, then ``--repeats`` times, and the fastest run is kept. ``--compare baseline.json`` flags every metric that got slower or larger
+than the baseline by more than ``--threshold`` and by at least ``--min-seconds`` (or
+``--min-bytes`` for memory), and exits with status 1 if there are any. Add
+``--current results.json`` to compare two stored runs without benchmarking again.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from point_set import DISTRIBUTIONS, generate_random_points
+from range_trees.arraytree import ArrayRangeTree
+from range_trees.compact import CompactRangeTree
+from range_trees.index import (ArrayRangeTreeIndex, CompactRangeTreeIndex, KDTreeIndex, RangeTreeIndex,
+                               available_memory)
+from range_trees.kdtree import KDTree
+from range_trees.rangetree import TreeNode
+
+ENGINES = {
+    "tree": TreeNode,
+    "compact": CompactRangeTree,
+    "array": ArrayRangeTree,
+    "kd": KDTree,
+}
+
+# The SpatialIndex adapter of each engine, for its size estimate.
+INDEXES = {
+    "tree": RangeTreeIndex,
+    "compact": CompactRangeTreeIndex,
+    "array": ArrayRangeTreeIndex,
+    "kd": KDTreeIndex,
+}
+
+PERCENTILES = (50, 90, 99)
+
+
+def _points(n, dimensions, distribution):
+    return list(zip(*(c.tolist() for c in generate_random_points(n, np.sqrt(n), dimensions, distribution))))
+
+
+def _boxes(points, count):
+    """Random query boxes spanning up to half of each coordinate's range."""
+    coordinates = np.asarray(points)
+    low, high = coordinates.min(axis=0), coordinates.max(axis=0)
+    span = np.maximum(high - low, 1)
+    start = low + np.random.random_sample((count, coordinates.shape[1])) * span
+    end = start + np.random.random_sample((count, coordinates.shape[1])) * span / 2
+    return [(tuple(s.tolist()), tuple(e.tolist())) for s, e in zip(start, end)]
+
+
+def _fastest(run, repeats):
+    """The shortest of ``repeats`` timed calls of ``run``, after one untimed call."""
+    run()
+    best = float("inf")
+    for _ in range(repeats):
+        begin = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - begin)
+    return best
+
+
+def _latencies(query, boxes, repeats):
+    timings = np.asarray([_fastest(lambda: query(start, end), repeats) for start, end in boxes])
+    summary = {f"p{p}": float(np.percentile(timings, p)) for p in PERCENTILES}
+    summary["mean"] = float(timings.mean())
+    return summary
+
+
+def run_case(engine, n, dimensions, distribution, num_queries, measure_memory, repeats=3):
+    cls = ENGINES[engine]
+    points = _points(n, dimensions, distribution)
+    result = {
+        "engine": engine,
+        "n": n,
+        "dimensions": dimensions,
+        "distribution": distribution,
+        "build_seconds": _fastest(lambda: cls.create_from_points(points), repeats),
+    }
+    if measure_memory:
+        # tracemalloc slows allocation down, so memory is measured on a build of its own.
+        tracemalloc.start()
+        tree = cls.create_from_points(points)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        tree = cls.create_from_points(points)
+    boxes = _boxes(points, num_queries)
+    result["queries"] = {
+        "range_point_query": _latencies(lambda s, e: list(tree.range_point_query(s, e)), boxes, repeats),
+        "range_count": _latencies(tree.range_count, boxes, repeats),
+    }
+    if hasattr(tree, "range_query"):
+        # The compact tree and the kd-tree have no first-layer search to time on its own.
+        result["queries"]["range_query"] = _latencies(lambda s, e: list(tree.range_query(s[0], e[0])), boxes,
+                                                     repeats)
+    return result
+
+
+def run(args):
+    results = []
+    memory_budget = args.memory_budget if args.memory_budget is not None else available_memory() // 2
+    for engine in args.engines:
+        for dimensions in args.dimensions:
+            for distribution in args.distributions:
+                for n in args.sizes:
+                    estimate = INDEXES[engine].estimate_bytes(n, dimensions)
+                    if estimate > memory_budget:
+                        print(f"{engine:>5} d={dimensions} {distribution:>9} n={n:>8}: skipped, needs about "
+                              f"{estimate / 2 ** 20:.1f} MiB of a {memory_budget / 2 ** 20:.1f} MiB budget",
+                              file=sys.stderr)
+                        continue
+                    np.random.seed(args.seed)
+                    result = run_case(engine, n, dimensions, distribution, args.queries, not args.skip_memory,
+                                      args.repeats)
+                    print(f"{engine:>5} d={dimensions} {distribution:>9} n={n:>8}: "
+                          f"build {result['build_seconds']:.3f}s, "
+                          f"count p50 {result['queries']['range_count']['p50'] * 1e6:.1f}us", file=sys.stderr)
+                    results.append(result)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "timestamp": time.time(),
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+
+
+def _metrics(result):
+    yield "build_seconds", result["build_seconds"]
+    if "peak_memory_bytes" in result:
+        yield "peak_memory_bytes", result["peak_memory_bytes"]
+    for query, summary in result["queries"].items():
+        for statistic, value in summary.items():
+            yield f"{query}.{statistic}", value
+
+
+def compare(baseline, current, threshold, min_seconds=0.0, min_bytes=0):
+    """Return ``(case, metric, baseline, current)`` for every metric more than ``threshold`` worse.
+
+    A metric also has to be worse by at least ``min_seconds`` (``min_bytes`` for memory), so
+    that noise on very short timings is not reported.
+    """
+    def case(result):
+        return result["engine"], result["n"], result["dimensions"], result["distribution"]
+
+    baseline_results = {case(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        if case(result) not in baseline_results:
+            continue
+        old_metrics = dict(_metrics(baseline_results[case(result)]))
+        for metric, value in _metrics(result):
+            old = old_metrics.get(metric)
+            min_delta = min_bytes if metric.endswith("_bytes") else min_seconds
+            if old and value > old * (1 + threshold) and value - old >= min_delta:
+                regressions.append((case(result), metric, old, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument("--dimensions", nargs="+", type=int, default=[1, 2, 3, 4])
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    parser.add_argument("--queries", type=int, default=200, help="query boxes per case")
+    parser.add_argument("--memory-budget", type=int,
+                        help="skip cases whose estimated index size is over this many bytes "
+                             "(default: half of the available memory)")
+    parser.add_argument("--skip-memory", action="store_true", help="do not measure peak build memory")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="timed runs of every build and query after a warmup; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=6851)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against this results file")
+    parser.add_argument("--current", help="with --compare, compare this results file instead of running")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown or growth counted as a regression")
+    parser.add_argument("--min-seconds", type=float, default=1e-5,
+                        help="smallest absolute slowdown counted as a regression")
+    parser.add_argument("--min-bytes", type=int, default=64 * 1024,
+                        help="smallest absolute memory growth counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run(args)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+        else:
+            json.dump(current, sys.stdout, indent=2)
+            print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold, args.min_seconds, args.min_bytes)
+        for (engine, n, dimensions, distribution), metric, old, new in regressions:
+            print(f"REGRESSION {engine} n={n} d={dimensions} {distribution} {metric}: "
+                  f"{old:.6g} -> {new:.6g} ({new / old - 1:+.0%})", file=sys.stderr)
+        if regressions:
+            return 1
+        print("no regressions", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
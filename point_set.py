@@ -1,7 +1,25 @@
 import random
 import numpy as np
 
-def generate_random_points(num_points, range):
-    return (np.random.randint(-range, range, num_points),
-            np.random.randint(-range, range, num_points),
-            np.random.randint(-range, range, num_points))
\ No newline at end of file
+DISTRIBUTIONS = ("uniform", "clustered", "skewed")
+
+
+def generate_random_points(num_points, range, dimensions=3, distribution="uniform"):
+    """Return one array of integer coordinates in [-range, range) per dimension.
+
+    ``clustered`` draws points around a few random centers; ``skewed`` piles most points up
+    near -range, which produces long runs of equal coordinates.
+    """
+    if distribution == "uniform":
+        return tuple(np.random.randint(-range, range, (dimensions, num_points)))
+    if distribution == "clustered":
+        num_clusters = max(1, int(num_points ** 0.25))
+        centers = np.random.randint(-range, range, (num_clusters, dimensions))
+        labels = np.random.randint(0, num_clusters, num_points)
+        points = np.random.normal(centers[labels], max(1.0, range / 10))
+    elif distribution == "skewed":
+        points = -range + 2 * range * np.random.random_sample((num_points, dimensions)) ** 3
+    else:
+        raise ValueError(f"unknown distribution {distribution!r}; expected one of {DISTRIBUTIONS}")
+    points = np.clip(np.floor(points), -range, np.ceil(range) - 1).astype(np.int64)
+    return tuple(points.T)
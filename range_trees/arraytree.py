@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import json
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import RawArray
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import progress
+
+_MAGIC = b"RNGTREE\0"
+_FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sII")  # magic, format version, header length
+_ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+class Block(NamedTuple):
+    """A canonical node of an :class:`ArrayRangeTree` layer.
+
+    Nodes are never materialized: a node of size ``2 ** exponent`` is the aligned run of
+    positions ``[start, start + size)`` in its layer's arrays.
+    """
+    exponent: int
+    start: int
+
+    @property
+    def size(self) -> int:
+        return 1 << self.exponent
+
+
+def canonical_blocks(start: int, end: int) -> List[Block]:
+    """Decompose the positions ``[start, end)`` into O(log n) aligned power-of-two blocks, in order."""
+    left: List[Block] = []
+    right: List[Block] = []
+    exponent = 0
+    while start < end:
+        step = 1 << exponent
+        if start & step:
+            left.append(Block(exponent, start))
+            start += step
+        if start < end and end & step:
+            end -= step
+            right.append(Block(exponent, end))
+        exponent += 1
+    return left + right[::-1]
+
+
+def _search_segments(keys: np.ndarray, lo: np.ndarray, hi: np.ndarray, values: np.ndarray,
+                     side: str) -> np.ndarray:
+    """Binary search every ``values[i]`` in its own sorted slice ``keys[lo[i]:hi[i]]`` at once.
+
+    All searches advance one halving step per iteration, so the loop runs once per level of the
+    largest segment and each iteration is a handful of vectorized comparisons.
+    """
+    lo = lo.copy()
+    hi = hi.copy()
+    while True:
+        active = np.flatnonzero(lo < hi)
+        if not len(active):
+            return lo
+        mid = (lo[active] + hi[active]) >> 1
+        if side == "left":
+            go_right = keys[mid] < values[active]
+        else:
+            go_right = keys[mid] <= values[active]
+        lo[active[go_right]] = mid[go_right] + 1
+        hi[active[~go_right]] = mid[~go_right]
+
+
+def _batch_canonical_blocks(queries: np.ndarray, start: np.ndarray, end: np.ndarray,
+                            top: int) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Vectorized :func:`canonical_blocks`: yield ``(exponent, queries, starts)`` per block size."""
+    start = start.copy()
+    end = end.copy()
+    for exponent in range(top + 1):
+        step = 1 << exponent
+        take_start = ((start & step) != 0) & (start < end)
+        block_starts = start[take_start]
+        start[take_start] += step
+        take_end = ((end & step) != 0) & (start < end)
+        end[take_end] -= step
+        if len(block_starts) or take_end.any():
+            yield (exponent, np.concatenate([queries[take_start], queries[take_end]]),
+                   np.concatenate([block_starts, end[take_end]]))
+
+
+def _top_exponent(n: int) -> int:
+    """The exponent of the smallest power of two that covers ``n`` positions."""
+    return max(0, (n - 1).bit_length())
+
+
+def _id_type(n: int) -> np.dtype:
+    return np.dtype(np.int32 if n < 2 ** 31 else np.int64)
+
+
+def _ranks(points: np.ndarray) -> np.ndarray:
+    """Dense per-dimension ranks, ties broken by point id, so every block sort is an integer sort."""
+    n, dimensions = points.shape
+    ranks = np.empty((n, dimensions), dtype=np.int64)
+    for index in range(dimensions):
+        ranks[np.argsort(points[:, index], kind="stable"), index] = np.arange(n)
+    return ranks
+
+
+def _layout(n: int, dimensions: int, exponents: Tuple[int, ...], index: int) -> Iterator[Tuple[str, Tuple[int, ...]]]:
+    """List the ``(kind, exponents)`` arrays that :func:`_build` stores below ``exponents``."""
+    yield "keys", exponents
+    if index + 1 == dimensions:
+        yield "ids", exponents
+        return
+    for exponent in range((exponents[-1] if exponents else _top_exponent(n)) + 1):
+        yield from _layout(n, dimensions, exponents + (exponent,), index + 1)
+
+
+def _build(points: np.ndarray, ranks: np.ndarray, order: np.ndarray, exponents: Tuple[int, ...], index: int,
+           store: Callable[[str, Tuple[int, ...], np.ndarray], None]):
+    """Build the layer ``index`` arrays whose blocks of size ``2 ** exponents[-1]`` are sorted in ``order``."""
+    n, dimensions = points.shape
+    store("keys", exponents, points[order, index])
+    if index + 1 == dimensions:
+        store("ids", exponents, order)
+        return
+    positions = np.arange(n, dtype=np.int64)
+    next_ranks = ranks[order, index + 1]
+    # Blocks of size 1 are trivially sorted; each larger size merges two sorted runs.
+    child = np.arange(n)
+    for exponent in range((exponents[-1] if exponents else _top_exponent(n)) + 1):
+        if exponent:
+            composite = (positions >> exponent) * n + next_ranks[child]
+            child = child[np.argsort(composite, kind="stable")]
+        _build(points, ranks, order[child], exponents + (exponent,), index + 1, store)
+
+
+# Set in each worker process by _init_worker: the shared input arrays and output buffer.
+_worker_state: Dict[str, object] = {}
+
+
+def _shared_array(buffer, dtype: np.dtype, shape: Tuple[int, ...], offset: int = 0) -> np.ndarray:
+    count = int(np.prod(shape))
+    return np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+
+def _init_worker(points_buffer, points_dtype: str, ranks_buffer, shape: Tuple[int, int], output_buffer,
+                 slots: Dict[Tuple[str, Tuple[int, ...]], Tuple[int, str, Tuple[int, ...]]]):
+    _worker_state["points"] = _shared_array(points_buffer, np.dtype(points_dtype), shape)
+    _worker_state["ranks"] = _shared_array(ranks_buffer, np.dtype(np.int64), shape)
+    _worker_state["output"] = output_buffer
+    _worker_state["slots"] = slots
+
+
+def _build_top_exponent(exponent: int):
+    """Build every associated array under first-layer nodes of size ``2 ** exponent`` into the shared output."""
+    points, ranks = _worker_state["points"], _worker_state["ranks"]
+    output, slots = _worker_state["output"], _worker_state["slots"]
+    n = len(points)
+
+    def store(kind: str, exponents: Tuple[int, ...], array: np.ndarray):
+        offset, dtype, shape = slots[kind, exponents]
+        _shared_array(output, np.dtype(dtype), shape, offset)[...] = array
+
+    first = np.empty(n, dtype=np.int64)
+    first[ranks[:, 0]] = np.arange(n)
+    composite = (np.arange(n, dtype=np.int64) >> exponent) * n + ranks[first, 1]
+    _build(points, ranks, first[np.argsort(composite, kind="stable")], (exponent,), 1, store)
+
+
+class ArrayRangeTree:
+    """A multi-dimensional range tree stored as flat NumPy arrays.
+
+    The first layer is the points sorted by their first coordinate. The node of size
+    ``2 ** e`` starting at position ``p`` covers positions ``[p, p + 2 ** e)``; with aligned
+    power-of-two nodes, subtree sizes and child offsets are implicit in the position.
+
+    The associated structures of all nodes of size ``2 ** e`` partition the points, so they
+    are stored together: one array per layer and per tuple of node exponents along the path,
+    where every aligned block of the array is sorted by the next coordinate. Lookups inside a
+    block are a single ``np.searchsorted`` on a slice, so a query never touches a Python
+    object per node.
+    """
+
+    def __init__(self, points: np.ndarray, keys: Dict[Tuple[int, ...], np.ndarray],
+                 ids: Dict[Tuple[int, ...], np.ndarray]):
+        self.points = points
+        self._keys = keys
+        self._ids = ids
+
+    @property
+    def size(self) -> int:
+        return len(self.points)
+
+    @property
+    def dimensions(self) -> int:
+        return self.points.shape[1]
+
+    @classmethod
+    def create_from_points(cls, points: Sequence[Tuple], *, workers: Optional[int] = None) -> ArrayRangeTree:
+        """Build the tree over ``points``.
+
+        With ``workers`` > 1, the associated arrays under the first-layer nodes of each size are
+        built in a process pool. The points go to the workers and the results come back
+        through one shared buffer, so no arrays are pickled; the final arrays are views of it.
+        """
+        assert len(points)
+        points = np.asarray(points)
+        assert points.ndim == 2 and points.shape[1]
+        n, dimensions = points.shape
+        ranks = _ranks(points)
+        id_type = _id_type(n)
+        keys: Dict[Tuple[int, ...], np.ndarray] = {}
+        ids: Dict[Tuple[int, ...], np.ndarray] = {}
+        monitor = progress.current()
+
+        def store(kind: str, exponents: Tuple[int, ...], array: np.ndarray):
+            if kind == "keys":
+                keys[exponents] = array
+                if monitor is not None:
+                    monitor.advance(len(exponents), len(array))
+            else:
+                ids[exponents] = array.astype(id_type)
+
+        first = np.argsort(ranks[:, 0])
+        # Object coordinates cannot live in a shared buffer, so they are always built serially.
+        if not workers or workers <= 1 or dimensions == 1 or points.dtype.hasobject:
+            _build(points, ranks, first, (), 0, store)
+            return cls(points, keys, ids)
+
+        store("keys", (), points[first, 0])
+        slots = {}
+        offset = 0
+        for exponent in range(_top_exponent(n) + 1):
+            for kind, exponents in _layout(n, dimensions, (exponent,), 1):
+                dtype = points.dtype if kind == "keys" else id_type
+                slots[kind, exponents] = (offset, dtype.str, (n,))
+                offset = _aligned(offset + n * dtype.itemsize)
+        output = RawArray("b", offset)
+        points_buffer = RawArray("b", points.nbytes)
+        _shared_array(points_buffer, points.dtype, points.shape)[...] = points
+        ranks_buffer = RawArray("b", ranks.nbytes)
+        _shared_array(ranks_buffer, ranks.dtype, ranks.shape)[...] = ranks
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(points_buffer, points.dtype.str, ranks_buffer, points.shape,
+                                           output, slots)) as executor:
+            # Larger node sizes own more associated arrays, so start them first.
+            exponents = list(reversed(range(_top_exponent(n) + 1)))
+            for exponent, _ in zip(exponents, executor.map(_build_top_exponent, exponents)):
+                if monitor is not None:
+                    arrays = sum(kind == "keys" for kind, _ in _layout(n, dimensions, (exponent,), 1))
+                    monitor.advance(1, arrays * n)
+        for (kind, exponents), (offset, dtype, shape) in slots.items():
+            array = _shared_array(output, np.dtype(dtype), shape, offset)
+            (keys if kind == "keys" else ids)[exponents] = array
+        return cls(points, keys, ids)
+
+    def save(self, path: str):
+        """Write the tree to ``path`` in a flat binary layout.
+
+        The file is a fixed prefix (magic, format version, header length), a JSON header
+        listing every array's kind, exponent tuple, dtype, shape and byte offset, then the
+        arrays themselves, each aligned to 64 bytes. Sizes and child offsets are implicit in
+        the aligned block layout, so the arrays are the points, the per-layer keys and the
+        last layer's point ids.
+        """
+        if self.points.dtype.hasobject:
+            raise ValueError("only trees over numeric coordinates can be saved")
+        arrays = [("points", (), self.points)]
+        arrays.extend(("keys", exponents, keys) for exponents, keys in self._keys.items())
+        arrays.extend(("ids", exponents, ids) for exponents, ids in self._ids.items())
+        entries = []
+        offset = 0
+        for kind, exponents, array in arrays:
+            entries.append({"kind": kind, "exponents": list(exponents), "dtype": array.dtype.str,
+                            "shape": list(array.shape), "offset": offset})
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps({"size": self.size, "dimensions": self.dimensions, "arrays": entries}).encode()
+        data_start = _aligned(_PREFIX.size + len(header))
+        with open(path, "wb") as f:
+            f.write(_PREFIX.pack(_MAGIC, _FORMAT_VERSION, len(header)))
+            f.write(header)
+            for entry, (_, _, array) in zip(entries, arrays):
+                f.seek(data_start + entry["offset"])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> ArrayRangeTree:
+        """Read a tree written by :meth:`save`.
+
+        With ``mmap``, the arrays are read-only views of a memory map of the file: loading is
+        near-instant, and processes that load the same file share its pages in the page cache.
+        """
+        with open(path, "rb") as f:
+            magic, version, header_length = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a saved range tree")
+            if version != _FORMAT_VERSION:
+                raise ValueError(f"unsupported range tree format version {version}")
+            header = json.loads(f.read(header_length).decode())
+        data_start = _aligned(_PREFIX.size + header_length)
+        if mmap:
+            buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            buffer = np.fromfile(path, dtype=np.uint8)
+        points = None
+        keys: Dict[Tuple[int, ...], np.ndarray] = {}
+        ids: Dict[Tuple[int, ...], np.ndarray] = {}
+        for entry in header["arrays"]:
+            dtype = np.dtype(entry["dtype"])
+            start = data_start + entry["offset"]
+            count = int(np.prod(entry["shape"]))
+            array = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(entry["shape"])
+            if entry["kind"] == "points":
+                points = array
+            elif entry["kind"] == "keys":
+                keys[tuple(entry["exponents"])] = array
+            else:
+                ids[tuple(entry["exponents"])] = array
+        return cls(points, keys, ids)
+
+    def range_query(self, start, end) -> Iterator[Block]:
+        """Yield the canonical nodes of the first layer whose keys lie in ``[start, end]``."""
+        keys = self._keys[()]
+        yield from canonical_blocks(int(np.searchsorted(keys, start, "left")),
+                                    int(np.searchsorted(keys, end, "right")))
+
+    def _last_layer_runs(self, start_point, end_point) -> Iterator[Tuple[Tuple[int, ...], int, int]]:
+        """Yield ``(exponents, start, end)`` runs of the last-layer arrays holding exactly the points in the box."""
+        assert len(start_point) == len(end_point) == self.dimensions
+        segments = [((), 0, self.size)]
+        for index in range(self.dimensions):
+            last = index + 1 == self.dimensions
+            next_segments = []
+            for exponents, lo, hi in segments:
+                keys = self._keys[exponents][lo:hi]
+                start = lo + int(np.searchsorted(keys, start_point[index], "left"))
+                end = lo + int(np.searchsorted(keys, end_point[index], "right"))
+                if last:
+                    if start < end:
+                        yield exponents, start, end
+                else:
+                    next_segments.extend((exponents + (b.exponent,), b.start, b.start + b.size)
+                                         for b in canonical_blocks(start, end))
+            segments = next_segments
+
+    def canonical_runs(self, start_point, end_point) -> Iterator[np.ndarray]:
+        """Yield the ids of the points inside the box as O(log^d n) views of the last-layer arrays."""
+        for exponents, start, end in self._last_layer_runs(start_point, end_point):
+            yield self._ids[exponents][start:end]
+
+    def range_point_indices(self, start_point, end_point) -> np.ndarray:
+        """Return the ids (rows of ``points``) of all points inside the box."""
+        found = [self._ids[exponents][start:end]
+                 for exponents, start, end in self._last_layer_runs(start_point, end_point)]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(found)
+
+    def range_count(self, start_point, end_point) -> int:
+        """Count the points inside the box without gathering their ids."""
+        return sum(end - start for _, start, end in self._last_layer_runs(start_point, end_point))
+
+    def range_point_query(self, start_point, end_point) -> Iterator[Tuple]:
+        for row in self.points[self.range_point_indices(start_point, end_point)].tolist():
+            yield tuple(row)
+
+    def _batch_last_layer(self, boxes) -> Iterator[Tuple[Tuple[int, ...], np.ndarray, np.ndarray, np.ndarray]]:
+        """Run all boxes through the layers together.
+
+        Yields ``(exponents, queries, start, end)``: query ``queries[i]`` matches positions
+        ``[start[i], end[i])`` of the last-layer arrays under ``exponents``.
+        """
+        boxes = np.asarray(boxes)
+        assert boxes.ndim == 3 and boxes.shape[1] == 2 and boxes.shape[2] == self.dimensions
+        m = len(boxes)
+        top = max(0, (self.size - 1).bit_length())
+        # The first layer is one sorted array; searching with sorted needles keeps successive
+        # searches in nearby parts of the keys.
+        keys = self._keys[()]
+        positions = []
+        for side, values in (("left", boxes[:, 0, 0]), ("right", boxes[:, 1, 0])):
+            order = np.argsort(values, kind="stable")
+            found = np.empty(m, dtype=np.int64)
+            found[order] = np.searchsorted(keys, values[order], side)
+            positions.append(found)
+        start, end = positions
+        groups = {(): (np.arange(m), start, np.maximum(start, end))}
+        for index in range(1, self.dimensions):
+            next_groups: Dict[Tuple[int, ...], List[Tuple[np.ndarray, np.ndarray]]] = {}
+            for exponents, (queries, start, end) in groups.items():
+                limit = exponents[-1] if exponents else top
+                for exponent, block_queries, block_starts in _batch_canonical_blocks(queries, start, end, limit):
+                    next_groups.setdefault(exponents + (exponent,), []).append((block_queries, block_starts))
+            groups = {}
+            for exponents, parts in next_groups.items():
+                queries = np.concatenate([q for q, _ in parts])
+                lo = np.concatenate([b for _, b in parts])
+                hi = np.minimum(lo + (1 << exponents[-1]), self.size)
+                keys = self._keys[exponents]
+                start = _search_segments(keys, lo, hi, boxes[queries, 0, index], "left")
+                end = _search_segments(keys, lo, hi, boxes[queries, 1, index], "right")
+                groups[exponents] = (queries, start, np.maximum(start, end))
+        for exponents, (queries, start, end) in groups.items():
+            yield exponents, queries, start, end
+
+    def batch_range_count(self, boxes) -> np.ndarray:
+        """Count the points in each of the ``(m, 2, d)`` boxes ``[[start_point, end_point], ...]``."""
+        counts = np.zeros(len(boxes), dtype=np.int64)
+        for _, queries, start, end in self._batch_last_layer(boxes):
+            counts += np.bincount(queries, weights=end - start, minlength=len(counts)).astype(np.int64)
+        return counts
+
+    def batch_range_query(self, boxes) -> Tuple[np.ndarray, np.ndarray]:
+        """Report the points in each of the ``(m, 2, d)`` boxes in CSR form.
+
+        Returns ``(offsets, indices)``: the ids of the points in box ``i`` are
+        ``indices[offsets[i]:offsets[i + 1]]``.
+        """
+        all_queries, all_indices = [], []
+        for exponents, queries, start, end in self._batch_last_layer(boxes):
+            lengths = end - start
+            total = int(lengths.sum())
+            if not total:
+                continue
+            # Expand each [start, end) run into consecutive positions without a Python loop.
+            run_offsets = np.cumsum(lengths) - lengths
+            positions = np.repeat(start - run_offsets, lengths) + np.arange(total)
+            all_queries.append(np.repeat(queries, lengths))
+            all_indices.append(self._ids[exponents][positions])
+        if not all_queries:
+            return np.zeros(len(boxes) + 1, dtype=np.int64), np.empty(0, dtype=np.int64)
+        queries = np.concatenate(all_queries)
+        indices = np.concatenate(all_indices)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(queries, minlength=len(boxes)))])
+        return offsets, indices[np.argsort(queries, kind="stable")]
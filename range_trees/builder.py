@@ -0,0 +1,110 @@
+"""Index construction under a memory budget, with progress reporting and cancellation.
+
+A :class:`TreeBuilder` estimates the entries and bytes of the index from ``n`` and ``d`` before
+building anything. An index that would not fit the budget is refused, or replaced by the
+first engine of :func:`~range_trees.index.select_index`'s preference that does. While it
+builds, progress can be polled from :attr:`TreeBuilder.progress` or pushed to a callback,
+and :meth:`TreeBuilder.cancel` stops the build from any thread::
+
+    builder = TreeBuilder(RangeTreeIndex, memory_budget=2 ** 30, callback=print)
+    index = builder(points)
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Tuple, Type, Union
+
+from .index import _PREFERENCE, INDEXES, SpatialIndex, available_memory
+from .progress import BuildCancelled, BuildMonitor, BuildProgress, monitor_build
+
+
+class BudgetExceeded(MemoryError):
+    """Raised instead of building an index whose estimated size is over the memory budget."""
+
+
+@dataclass(frozen=True)
+class BuildEstimate:
+    """The engine a build will use, and the entries and bytes it is estimated to store."""
+    index: Type[SpatialIndex]
+    entries: int
+    bytes: int
+
+    @classmethod
+    def of(cls, index: Type[SpatialIndex], n: int, dimensions: int) -> BuildEstimate:
+        return cls(index, index.estimate_entries(n, dimensions), index.estimate_bytes(n, dimensions))
+
+
+class TreeBuilder:
+    """Builds ``index`` (a class or its name in :data:`INDEXES`) over a list of points.
+
+    ``memory_budget`` defaults to half of the available memory. With ``fallback``, an index
+    over the budget is replaced by the fastest cheaper engine that fits; without it, or when
+    nothing fits, :class:`BudgetExceeded` is raised. ``index=None`` always picks the fastest
+    engine that fits. ``callback`` receives a :class:`BuildProgress` about every ``interval``
+    seconds on the build thread. A builder is callable, so it can be the build function of
+    a :class:`~range_trees.service.RangeTreeService`; use a new one for every build, since a
+    cancelled builder stays cancelled.
+    """
+
+    def __init__(self, index: Union[str, Type[SpatialIndex], None] = None, *, memory_budget: Optional[int] = None,
+                 fallback: bool = True, callback: Optional[Callable[[BuildProgress], None]] = None,
+                 interval: float = 0.1):
+        self.index = INDEXES[index] if isinstance(index, str) else index
+        self.memory_budget = memory_budget
+        self.fallback = fallback
+        self.callback = callback
+        self.interval = interval
+        self._monitor: Optional[BuildMonitor] = None
+        self._cancelled = threading.Event()
+
+    @property
+    def progress(self) -> Optional[BuildProgress]:
+        """The latest progress of the build, or ``None`` before it starts."""
+        monitor = self._monitor
+        return monitor.progress if monitor is not None else None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stop the build at its next progress report; a build that has not started will not start."""
+        self._cancelled.set()
+        monitor = self._monitor
+        if monitor is not None:
+            monitor.cancel()
+
+    def plan(self, n: int, dimensions: int) -> BuildEstimate:
+        """Choose the engine for ``n`` points of ``dimensions`` coordinates without building anything."""
+        budget = self.memory_budget if self.memory_budget is not None else available_memory() // 2
+        requested = [BuildEstimate.of(self.index, n, dimensions)] if self.index is not None else []
+        candidates = list(requested)
+        if self.fallback or not requested:
+            candidates += [BuildEstimate.of(index, n, dimensions) for index in _PREFERENCE if index is not self.index]
+        for estimate in candidates:
+            if estimate.bytes <= budget:
+                return estimate
+        smallest = min(candidates, key=lambda estimate: estimate.bytes)
+        wanted = requested[0] if requested else smallest
+        raise BudgetExceeded(f"{wanted.index.label} over {n} points needs about {wanted.bytes / 2 ** 20:.0f} MiB, "
+                             f"over the budget of {budget / 2 ** 20:.0f} MiB"
+                             + ("" if wanted is smallest else
+                                f"; the smallest engine, {smallest.index.label}, needs about "
+                                f"{smallest.bytes / 2 ** 20:.0f} MiB"))
+
+    def __call__(self, points: Sequence[Tuple]) -> SpatialIndex:
+        assert len(points)
+        dimensions = len(points[0])
+        estimate = self.plan(len(points), dimensions)
+        monitor = BuildMonitor(estimate.index.name, estimate.entries, dimensions,
+                               callback=self.callback, interval=self.interval)
+        self._monitor = monitor
+        # A cancel() that ran before the monitor was published only set the flag.
+        if self.cancelled:
+            monitor.cancel()
+        monitor.check()
+        with monitor_build(monitor):
+            index = estimate.index.build(points)
+        monitor.finish()
+        return index
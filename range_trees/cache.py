@@ -0,0 +1,158 @@
+"""An LRU cache for box queries that reuses results of enclosing boxes.
+
+Entries are keyed by a tree version and a box. A query whose box lies inside a cached
+points result of the same version is answered by filtering that array instead of
+searching the tree again, which is what nested boxes and slider jitter produce.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple, Union
+
+import numpy as np
+
+from .arraytree import ArrayRangeTree
+from .index import SpatialIndex, as_index
+from .kdtree import KDTree
+from .rangetree import TreeNode
+
+# Nominal footprint of a cached count, so that counts also take up part of the budget.
+_COUNT_BYTES = 64
+
+Box = Tuple[Tuple, Tuple]
+Tree = Union[TreeNode, ArrayRangeTree, KDTree, SpatialIndex]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    containment_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.containment_hits + self.misses
+        return (self.hits + self.containment_hits) / total if total else 0.0
+
+
+def _contains(outer: Box, inner: Box) -> bool:
+    return (all(o <= i for o, i in zip(outer[0], inner[0]))
+            and all(i <= o for o, i in zip(outer[1], inner[1])))
+
+
+def _filter(points: np.ndarray, start_point, end_point) -> np.ndarray:
+    coordinates = points[:, :len(start_point)]
+    inside = np.all((coordinates >= np.asarray(start_point)) & (coordinates <= np.asarray(end_point)), axis=1)
+    return points[inside]
+
+
+class QueryCache:
+    """Caches point results and counts of box queries within ``max_bytes``, evicting least recently used.
+
+    ``version`` identifies the tree contents; it defaults to ``id(tree)``, so pass an explicit
+    version whenever a tree can change or be replaced. Cached arrays are returned read-only.
+    The cache can be shared between threads; tree searches run outside its lock.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._entries: OrderedDict[Tuple[str, Hashable, Box], Any] = OrderedDict()
+        self._sizes: Dict[Tuple[str, Hashable, Box], int] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def _get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value, size: int):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._sizes.pop(key)
+            del self._entries[key]
+        self._entries[key] = value
+        self._sizes[key] = size
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            old_key, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(old_key)
+            self.stats.evictions += 1
+
+    def _enclosing_points(self, version: Hashable, box: Box) -> Optional[np.ndarray]:
+        """The smallest cached points result of ``version`` whose box contains ``box``."""
+        best_key = None
+        for key, points in self._entries.items():
+            kind, key_version, key_box = key
+            if (kind == "points" and key_version == version and _contains(key_box, box)
+                    and (best_key is None or len(points) < len(self._entries[best_key]))):
+                best_key = key
+        return self._get(best_key) if best_key is not None else None
+
+    def points(self, tree: Tree, start_point, end_point,
+               version: Optional[Hashable] = None) -> np.ndarray:
+        """Return the points inside the box as an array with one row per point."""
+        version = id(tree) if version is None else version
+        box = (tuple(start_point), tuple(end_point))
+        key = ("points", version, box)
+        with self._lock:
+            points = self._get(key)
+            if points is not None:
+                self.stats.hits += 1
+                return points
+            enclosing = self._enclosing_points(version, box)
+            if enclosing is not None:
+                self.stats.containment_hits += 1
+            else:
+                self.stats.misses += 1
+        if enclosing is not None:
+            points = _filter(enclosing, start_point, end_point)
+        else:
+            points = as_index(tree).report(start_point, end_point)
+        points.flags.writeable = False
+        with self._lock:
+            self._put(key, points, points.nbytes)
+        return points
+
+    def count(self, tree: Tree, start_point, end_point,
+              version: Optional[Hashable] = None) -> int:
+        """Return the number of points inside the box."""
+        version = id(tree) if version is None else version
+        box = (tuple(start_point), tuple(end_point))
+        key = ("count", version, box)
+        with self._lock:
+            count = self._get(key)
+            if count is not None:
+                self.stats.hits += 1
+                return count
+            points = self._enclosing_points(version, box)
+            if points is not None:
+                self.stats.containment_hits += 1
+            else:
+                self.stats.misses += 1
+        if points is not None:
+            count = len(_filter(points, start_point, end_point))
+        else:
+            count = as_index(tree).count(start_point, end_point)
+        with self._lock:
+            self._put(key, count, _COUNT_BYTES)
+        return count
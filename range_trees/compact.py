@@ -0,0 +1,171 @@
+"""A memory-lean object range tree.
+
+:class:`TreeNode` keeps ``key``, ``min``, ``max``, ``value`` and a :class:`PointIndex` wrapper
+in every node's ``__dict__``, and compares keys through ``total_ordering``. Here nodes are
+slotted, leaves hold the bare coordinate and a point id into one shared coordinate array,
+internal nodes hold only the split key, and every comparison is between plain numbers.
+"""
+from __future__ import annotations
+
+import math
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import progress
+
+
+class CompactLeaf:
+    __slots__ = ("key", "id")
+    size = 1
+
+    def __init__(self, key, id: int):
+        self.key = key
+        self.id = id
+
+    def __repr__(self):
+        return f"Leaf({self.key}, id={self.id})"
+
+
+class CompactInternal:
+    """An internal node; keys in ``left`` are at most ``split`` and keys in ``right`` at least ``split``.
+
+    ``next`` is the tree on the next coordinate over the same points, or ``None`` in the last layer.
+    """
+    __slots__ = ("split", "size", "left", "right", "next")
+
+    def __init__(self, split, size: int, left: CompactNode, right: CompactNode,
+                 next: Optional[CompactNode] = None):
+        self.split = split
+        self.size = size
+        self.left = left
+        self.right = right
+        self.next = next
+
+    def __repr__(self):
+        return f"Node({self.left}, {self.right})"
+
+
+CompactNode = Union[CompactLeaf, CompactInternal]
+
+
+def leaf_ids(node: CompactNode, rank: int = 0) -> Iterator[int]:
+    """Yield the point ids of the leaves under ``node`` after skipping the first ``rank``, found in O(log n) by subtree size."""
+    stack = []
+    while rank and node.__class__ is not CompactLeaf:
+        if rank < node.left.size:
+            stack.append(node.right)
+            node = node.left
+        else:
+            rank -= node.left.size
+            node = node.right
+    if rank:
+        return
+    stack.append(node)
+    while stack:
+        node = stack.pop()
+        if node.__class__ is CompactLeaf:
+            yield node.id
+        else:
+            stack.append(node.right)
+            stack.append(node.left)
+
+
+class CompactRangeTree:
+    """A multi-dimensional range tree of :class:`CompactLeaf` and :class:`CompactInternal` nodes.
+
+    ``points`` is the shared coordinate array; leaves refer to its rows by id. A leaf of an
+    upper layer has no tree on the next coordinate: a query that reaches it checks the
+    remaining coordinates of its point directly.
+    """
+
+    def __init__(self, points: np.ndarray, root: CompactNode):
+        self.points = points
+        self.root = root
+
+    @property
+    def size(self) -> int:
+        return len(self.points)
+
+    @property
+    def dimensions(self) -> int:
+        return self.points.shape[1]
+
+    @classmethod
+    def create_from_points(cls, points: Sequence[Tuple]) -> CompactRangeTree:
+        assert len(points)
+        points = np.asarray(points)
+        assert points.ndim == 2 and points.shape[1]
+        dimensions = points.shape[1]
+        # Plain Python numbers, so that the keys stored in the leaves compare without NumPy.
+        columns = [points[:, i].tolist() for i in range(dimensions)]
+        monitor = progress.current()
+
+        def build_layer(ids: List[int], index: int) -> CompactNode:
+            keys = columns[index]
+            last = index + 1 == dimensions
+            next_key = None if last else columns[index + 1].__getitem__
+
+            def build(lo: int, hi: int):
+                """Return the subtree over ``ids[lo:hi]``, its largest key and, above the last layer, its ids by the next coordinate."""
+                if hi - lo == 1:
+                    id = ids[lo]
+                    if monitor is not None:
+                        monitor.advance(index)
+                    return CompactLeaf(keys[id], id), keys[id], [id]
+                mid = (lo + hi) // 2
+                left, split, left_ids = build(lo, mid)
+                right, largest, right_ids = build(mid, hi)
+                if last:
+                    return CompactInternal(split, hi - lo, left, right), largest, None
+                merged = sorted(left_ids + right_ids, key=next_key)  # timsort merges the two runs
+                return CompactInternal(split, hi - lo, left, right, build_layer(merged, index + 1)), largest, merged
+
+            return build(0, len(ids))[0]
+
+        with progress.collection_paused():
+            root = build_layer(sorted(range(len(points)), key=columns[0].__getitem__), 0)
+        return cls(points, root)
+
+    def _canonical(self, node: CompactNode, index: int, start_point: Tuple, end_point: Tuple) -> Iterator[CompactNode]:
+        start, end = start_point[index], end_point[index]
+        last = index + 1 == len(start_point)
+        # Bounds on the keys below each node follow from the splits on the way down.
+        stack = [(node, -math.inf, math.inf)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if hi < start or end < lo:
+                continue
+            if node.__class__ is CompactLeaf:
+                if start <= node.key <= end and (last or self._inside(node.id, index + 1, start_point, end_point)):
+                    yield node
+            elif start <= lo and hi <= end:
+                if last:
+                    yield node
+                else:
+                    yield from self._canonical(node.next, index + 1, start_point, end_point)
+            else:
+                split = node.split
+                stack.append((node.right, split, hi))
+                stack.append((node.left, lo, split))
+
+    def _inside(self, id: int, index: int, start_point: Tuple, end_point: Tuple) -> bool:
+        point = self.points[id].tolist()
+        return all(start_point[i] <= point[i] <= end_point[i] for i in range(index, len(point)))
+
+    def canonical_nodes(self, start_point, end_point) -> Iterator[CompactNode]:
+        """Yield the last-layer subtrees (or single leaves) whose points are exactly those inside the box."""
+        assert len(start_point) == len(end_point) == self.dimensions
+        yield from self._canonical(self.root, 0, tuple(start_point), tuple(end_point))
+
+    def range_point_indices(self, start_point, end_point) -> np.ndarray:
+        """Return the ids (rows of ``points``) of all points inside the box."""
+        return np.fromiter((id for node in self.canonical_nodes(start_point, end_point) for id in leaf_ids(node)),
+                           dtype=np.int64)
+
+    def range_count(self, start_point, end_point) -> int:
+        return sum(node.size for node in self.canonical_nodes(start_point, end_point))
+
+    def range_point_query(self, start_point, end_point) -> Iterator[Tuple]:
+        for row in self.points[self.range_point_indices(start_point, end_point)].tolist():
+            yield tuple(row)
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from .rangetree import Aggregate, CascadeList, PointIndex, TreeNode, composite_key
+
+# A node is balanced when each child holds at least this fraction of its points (BB[alpha]).
+ALPHA = 0.25
+
+
+def _is_balanced(left_size: int, right_size: int) -> bool:
+    return min(left_size, right_size) >= ALPHA * (left_size + right_size)
+
+
+def _rebuild(points: List[Tuple], index: int, dimensions: int, aggregates: Sequence[Aggregate]) -> TreeNode:
+    return TreeNode.create_from_points(points, index, dimensions=dimensions, aggregates=aggregates)
+
+
+def _points(node: TreeNode) -> List[Tuple]:
+    # The points come out of the leaves sorted by this layer's coordinate, so a rebuild from
+    # them only merges runs and never really sorts.
+    return [leaf.key.point for leaf in node.traverse_leaves()]
+
+
+def _finish(left: TreeNode, right: TreeNode, value, index: int, dimensions: int,
+            aggregates: Sequence[Aggregate]) -> TreeNode:
+    if _is_balanced(left.size, right.size):
+        return TreeNode.create_internal(left, right, value)
+    return _rebuild(_points(left) + _points(right), index, dimensions, aggregates)
+
+
+def insert(node: Optional[TreeNode], point: Tuple, index: int, dimensions: int,
+           aggregates: Sequence[Aggregate] = ()) -> TreeNode:
+    """Return a tree that also holds ``point``, leaving ``node`` untouched.
+
+    Nodes along the search path are copied and the point is inserted into each of their
+    associated trees. The topmost node the insertion would put out of weight balance has its
+    subtree rebuilt from scratch instead, once, and nothing below it is updated; this partial
+    rebuilding keeps updates at O(log^d n) amortized.
+    """
+    if node is None:
+        return _rebuild([point], index, dimensions, aggregates)
+    if isinstance(node.value, CascadeList):
+        raise ValueError("trees built with cascade=True cannot be updated")
+    if node.is_leaf:
+        points = sorted([node.key.point, point], key=composite_key(index, dimensions))
+        return _rebuild(points, index, dimensions, aggregates)
+    goes_left = node.left.max >= PointIndex(point, index, dimensions=dimensions)
+    if not _is_balanced(node.left.size + goes_left, node.right.size + (not goes_left)):
+        return _rebuild(_points(node) + [point], index, dimensions, aggregates)
+    value = node.value
+    if index + 1 < dimensions:
+        value = insert(value, point, index + 1, dimensions, aggregates)
+    if goes_left:
+        left, right = insert(node.left, point, index, dimensions, aggregates), node.right
+    else:
+        left, right = node.left, insert(node.right, point, index, dimensions, aggregates)
+    return TreeNode.create_internal(left, right, value)
+
+
+def delete(node: Optional[TreeNode], point: Tuple, index: int, dimensions: int,
+           aggregates: Sequence[Aggregate] = ()) -> Optional[TreeNode]:
+    """Return a tree without one copy of ``point`` (``None`` once it is empty), leaving ``node`` untouched.
+
+    Raises ``KeyError`` if the point is not in the tree. Subtrees are rebuilt as in :func:`insert`.
+    """
+    if node is None:
+        raise KeyError(point)
+    if isinstance(node.value, CascadeList):
+        raise ValueError("trees built with cascade=True cannot be updated")
+    if node.is_leaf:
+        if node.key.point != point:
+            raise KeyError(point)
+        return None
+    # Keys are ordered by all coordinates, so only copies of the same point can straddle the split.
+    left, right = node.left, node.right
+    key = PointIndex(point, index, dimensions=dimensions)
+    in_left, in_right = key <= left.max, key >= right.min
+    if in_left != in_right and min(left.size - in_left, right.size - in_right) > 0 \
+            and not _is_balanced(left.size - in_left, right.size - in_right):
+        points = _points(node)
+        try:
+            points.remove(point)
+        except ValueError:
+            raise KeyError(point) from None
+        return _rebuild(points, index, dimensions, aggregates)
+    if in_left:
+        try:
+            left = delete(left, point, index, dimensions, aggregates)
+        except KeyError:
+            if not key >= right.min:
+                raise
+            right = delete(right, point, index, dimensions, aggregates)
+    else:
+        right = delete(right, point, index, dimensions, aggregates)
+    if left is None:
+        return right
+    if right is None:
+        return left
+    value = node.value
+    if index + 1 < dimensions:
+        value = delete(value, point, index + 1, dimensions, aggregates)
+    if in_left != in_right:
+        return TreeNode.create_internal(left, right, value)
+    # Copies of the point on both sides of the split: the side it left is only known now.
+    return _finish(left, right, value, index, dimensions, aggregates)
+
+
+class DynamicRangeTree:
+    """A multi-dimensional range tree supporting :meth:`insert` and :meth:`delete`.
+
+    Queries are delegated to the underlying :class:`TreeNode`; an empty tree has no root.
+    """
+
+    def __init__(self, points: Sequence[Tuple] = (), *, dimensions: Optional[int] = None,
+                 aggregates: Sequence[Aggregate] = ()):
+        if dimensions is None and points:
+            dimensions = len(points[0])
+        self.dimensions = dimensions
+        self.aggregates = tuple(aggregates)
+        self.root: Optional[TreeNode] = None
+        if points:
+            self.root = TreeNode.create_from_points(points, dimensions=dimensions, aggregates=self.aggregates)
+
+    def __len__(self):
+        return self.root.size if self.root is not None else 0
+
+    def insert(self, point: Tuple):
+        if self.dimensions is None:
+            self.dimensions = len(point)
+        self.root = insert(self.root, point, 0, self.dimensions, self.aggregates)
+
+    def delete(self, point: Tuple):
+        self.root = delete(self.root, point, 0, self.dimensions, self.aggregates)
+
+    def range_point_query(self, start_point, end_point) -> Iterator[Tuple]:
+        if self.root is not None:
+            yield from self.root.range_point_query(start_point, end_point)
+
+    def range_count(self, start_point, end_point) -> int:
+        return self.root.range_count(start_point, end_point) if self.root is not None else 0
+
+    def range_aggregate(self, start_point, end_point, aggregate: Aggregate):
+        if self.root is None:
+            return aggregate.identity
+        return self.root.range_aggregate(start_point, end_point, aggregate)
+
+
+class VersionedRangeTree(DynamicRangeTree):
+    """A :class:`DynamicRangeTree` that keeps the root of every version.
+
+    Updates copy only the search paths, so each version shares all untouched subtrees (and
+    their associated trees) with the previous one. Version 0 is the initial point set and
+    every :meth:`insert` or :meth:`delete` creates the next version.
+    """
+
+    def __init__(self, points: Sequence[Tuple] = (), *, dimensions: Optional[int] = None,
+                 aggregates: Sequence[Aggregate] = ()):
+        super().__init__(points, dimensions=dimensions, aggregates=aggregates)
+        self.versions: List[Optional[TreeNode]] = [self.root]
+
+    @property
+    def version(self) -> int:
+        return len(self.versions) - 1
+
+    def insert(self, point: Tuple) -> int:
+        super().insert(point)
+        self.versions.append(self.root)
+        return self.version
+
+    def delete(self, point: Tuple) -> int:
+        super().delete(point)
+        self.versions.append(self.root)
+        return self.version
+
+    def as_of(self, version: int) -> DynamicRangeTree:
+        """Return the tree as it was at ``version``; updating it does not change the history."""
+        snapshot = DynamicRangeTree(dimensions=self.dimensions, aggregates=self.aggregates)
+        snapshot.root = self.versions[version]
+        return snapshot
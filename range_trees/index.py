@@ -0,0 +1,308 @@
+"""A common interface over the spatial index engines, and a selector that picks one.
+
+Every engine answers the same operations: ``build`` over a list of points, ``count`` and
+``report`` for one box, ``batch`` counts for many boxes and ``diff`` between two boxes. :func:`select_index`
+chooses the engine with the fastest queries whose estimated size fits a memory budget.
+"""
+from __future__ import annotations
+
+import math
+import os
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Type, Union
+
+import numpy as np
+
+from .arraytree import ArrayRangeTree, _layout
+from .compact import CompactRangeTree
+from .kdtree import KDTree
+from .rangetree import TreeNode
+
+# Measured bytes per stored entry, where a range tree stores about n * log2(n) ** (d - 1) entries.
+_TREE_NODE_BYTES = 550
+_CASCADE_ENTRY_BYTES = 130
+_COMPACT_NODE_BYTES = 80
+_ARRAY_ENTRY_BYTES = 16
+
+
+def _entries(n: int, dimensions: int) -> int:
+    return n * max(1, math.ceil(math.log2(max(n, 2)))) ** (dimensions - 1)
+
+
+def _leaves(n: int, dimensions: int, leaf_layers: bool = True) -> int:
+    """The leaves in every layer of a range tree over ``n`` points, counted for subtree sizes ``2 ** j``.
+
+    A layer over ``m`` points has ``m`` leaves plus those of the next layer under each of its
+    nodes, or only under its internal nodes without ``leaf_layers``.
+    """
+    top = math.ceil(math.log2(max(n, 1)))
+    first = 0 if leaf_layers else 1
+    leaves = [2 ** j for j in range(top + 1)]
+    for _ in range(dimensions - 1):
+        leaves = [2 ** j + sum(2 ** (j - i) * leaves[i] for i in range(first, j + 1)) for j in range(top + 1)]
+    return n * leaves[top] // 2 ** top
+
+
+def _box_minus(start, end, other_start, other_end) -> Iterator[Tuple[Tuple, Tuple]]:
+    """Split the part of box ``[start, end]`` outside ``[other_start, other_end]`` into disjoint boxes.
+
+    The coordinates are numbers; a bound just outside the other box is the next float past it.
+    """
+    if any(s > e for s, e in zip(start, end)):
+        return
+    # An empty other box, or one that misses this box on some coordinate, takes nothing away;
+    # the slabs below assume the two boxes overlap.
+    if any(os > oe or oe < s or e < os for s, e, os, oe in zip(start, end, other_start, other_end)):
+        yield tuple(start), tuple(end)
+        return
+    start, end = list(start), list(end)
+    for i in range(len(start)):
+        below = np.nextafter(float(other_start[i]), -math.inf).item()
+        if start[i] <= below:
+            yield tuple(start), tuple(end[:i] + [min(end[i], below)] + end[i + 1:])
+        above = np.nextafter(float(other_end[i]), math.inf).item()
+        if above <= end[i]:
+            yield tuple(start[:i] + [max(start[i], above)] + start[i + 1:]), tuple(end)
+        start[i], end[i] = max(start[i], other_start[i]), min(end[i], other_end[i])
+
+
+def _id_diff(tree, old_start, old_end, new_start, new_end) -> Tuple[List[Tuple], List[Tuple]]:
+    """:meth:`SpatialIndex.diff` for engines with ``range_point_indices``, searching only the boxes that changed."""
+    def report(boxes) -> List[Tuple]:
+        ids = [tree.range_point_indices(start, end) for start, end in boxes]
+        return list(map(tuple, tree.points[np.concatenate(ids)].tolist())) if ids else []
+
+    return (report(_box_minus(new_start, new_end, old_start, old_end)),
+            report(_box_minus(old_start, old_end, new_start, new_end)))
+
+
+def available_memory() -> int:
+    """Physical memory not in use right now, or 1 GiB where the platform does not report it."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return 2 ** 30
+
+
+class SpatialIndex(ABC):
+    """A static index over points answering orthogonal box queries.
+
+    ``report`` returns the points inside the box as an array with one row per point, and
+    ``batch`` takes ``(m, 2, d)`` boxes ``[[start_point, end_point], ...]``.
+    """
+    name = ""
+    label = ""
+
+    @classmethod
+    @abstractmethod
+    def build(cls, points: Sequence[Tuple]) -> SpatialIndex:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def estimate_bytes(n: int, dimensions: int) -> int:
+        """A rough size of the index over ``n`` points of ``dimensions`` coordinates."""
+
+    @staticmethod
+    def estimate_entries(n: int, dimensions: int) -> int:
+        """About how many entries building the index stores; builds report progress in these."""
+        return _leaves(n, dimensions)
+
+    @abstractmethod
+    def count(self, start_point, end_point) -> int:
+        pass
+
+    @abstractmethod
+    def report(self, start_point, end_point) -> np.ndarray:
+        pass
+
+    def batch(self, boxes) -> np.ndarray:
+        return np.array([self.count(start, end) for start, end in np.asarray(boxes).tolist()], dtype=np.int64)
+
+    def diff(self, old_start, old_end, new_start, new_end) -> Tuple[List[Tuple], List[Tuple]]:
+        """Return ``(entered, left)``: the points inside the new box but not the old one, and the reverse.
+
+        Duplicated points count once per copy.
+        """
+        old = Counter(map(tuple, self.report(old_start, old_end).tolist()))
+        new = Counter(map(tuple, self.report(new_start, new_end).tolist()))
+        return list((new - old).elements()), list((old - new).elements())
+
+
+class RangeTreeIndex(SpatialIndex):
+    name = "Regular"
+    label = "Regular Range Tree"
+    cascade = False
+
+    def __init__(self, tree: TreeNode):
+        self.tree = tree
+
+    @classmethod
+    def build(cls, points: Sequence[Tuple]) -> RangeTreeIndex:
+        return cls(TreeNode.create_from_points(points, cascade=cls.cascade))
+
+    @staticmethod
+    def estimate_bytes(n: int, dimensions: int) -> int:
+        return _TREE_NODE_BYTES * _entries(n, dimensions)
+
+    def count(self, start_point, end_point) -> int:
+        return self.tree.range_count(start_point, end_point)
+
+    def report(self, start_point, end_point) -> np.ndarray:
+        points = np.array(list(self.tree.range_point_query(start_point, end_point)))
+        return points if len(points) else points.reshape(0, len(start_point))
+
+    def diff(self, old_start, old_end, new_start, new_end) -> Tuple[List[Tuple], List[Tuple]]:
+        return self.tree.range_diff(old_start, old_end, new_start, new_end)
+
+
+class CascadingRangeTreeIndex(RangeTreeIndex):
+    name = "Cascading"
+    label = "Range Tree with Fractional Cascading"
+    cascade = True
+
+    @staticmethod
+    def estimate_bytes(n: int, dimensions: int) -> int:
+        if dimensions == 1:
+            return RangeTreeIndex.estimate_bytes(n, dimensions)
+        return (RangeTreeIndex.estimate_bytes(n, dimensions - 1)
+                + _CASCADE_ENTRY_BYTES * _entries(n, dimensions))
+
+
+class CompactRangeTreeIndex(SpatialIndex):
+    name = "Compact"
+    label = "Compact Range Tree"
+
+    def __init__(self, tree: CompactRangeTree):
+        self.tree = tree
+
+    @classmethod
+    def build(cls, points: Sequence[Tuple]) -> CompactRangeTreeIndex:
+        return cls(CompactRangeTree.create_from_points(points))
+
+    @staticmethod
+    def estimate_bytes(n: int, dimensions: int) -> int:
+        return 8 * n * dimensions + _COMPACT_NODE_BYTES * _entries(n, dimensions)
+
+    @staticmethod
+    def estimate_entries(n: int, dimensions: int) -> int:
+        # Leaves of an upper layer have no tree on the next coordinate.
+        return _leaves(n, dimensions, leaf_layers=False)
+
+    def count(self, start_point, end_point) -> int:
+        return self.tree.range_count(start_point, end_point)
+
+    def report(self, start_point, end_point) -> np.ndarray:
+        return self.tree.points[self.tree.range_point_indices(start_point, end_point)]
+
+    def diff(self, old_start, old_end, new_start, new_end) -> Tuple[List[Tuple], List[Tuple]]:
+        return _id_diff(self.tree, old_start, old_end, new_start, new_end)
+
+
+class ArrayRangeTreeIndex(SpatialIndex):
+    name = "Array"
+    label = "Array Range Tree"
+
+    def __init__(self, tree: ArrayRangeTree):
+        self.tree = tree
+
+    @classmethod
+    def build(cls, points: Sequence[Tuple]) -> ArrayRangeTreeIndex:
+        return cls(ArrayRangeTree.create_from_points(points))
+
+    @staticmethod
+    def estimate_bytes(n: int, dimensions: int) -> int:
+        return 8 * n * dimensions + _ARRAY_ENTRY_BYTES * _entries(n, dimensions)
+
+    @staticmethod
+    def estimate_entries(n: int, dimensions: int) -> int:
+        return n * sum(kind == "keys" for kind, _ in _layout(n, dimensions, (), 0))
+
+    def count(self, start_point, end_point) -> int:
+        return self.tree.range_count(start_point, end_point)
+
+    def report(self, start_point, end_point) -> np.ndarray:
+        return self.tree.points[self.tree.range_point_indices(start_point, end_point)]
+
+    def batch(self, boxes) -> np.ndarray:
+        return self.tree.batch_range_count(boxes)
+
+    def diff(self, old_start, old_end, new_start, new_end) -> Tuple[List[Tuple], List[Tuple]]:
+        return _id_diff(self.tree, old_start, old_end, new_start, new_end)
+
+
+class KDTreeIndex(SpatialIndex):
+    name = "KD"
+    label = "kd-Tree"
+
+    def __init__(self, tree: KDTree):
+        self.tree = tree
+
+    @classmethod
+    def build(cls, points: Sequence[Tuple]) -> KDTreeIndex:
+        return cls(KDTree.create_from_points(points))
+
+    @staticmethod
+    def estimate_bytes(n: int, dimensions: int) -> int:
+        return 8 * n * (dimensions + 1)
+
+    @staticmethod
+    def estimate_entries(n: int, dimensions: int) -> int:
+        # Every level of splits, down to the default leaf size of 16, partitions all the points once.
+        return n * max(0, -(-n // 16) - 1).bit_length()
+
+    def count(self, start_point, end_point) -> int:
+        return self.tree.range_count(start_point, end_point)
+
+    def report(self, start_point, end_point) -> np.ndarray:
+        return self.tree.points[self.tree.range_point_indices(start_point, end_point)]
+
+    def batch(self, boxes) -> np.ndarray:
+        return self.tree.batch_range_count(boxes)
+
+    def diff(self, old_start, old_end, new_start, new_end) -> Tuple[List[Tuple], List[Tuple]]:
+        return _id_diff(self.tree, old_start, old_end, new_start, new_end)
+
+
+def as_index(tree: Union[SpatialIndex, TreeNode, CompactRangeTree, ArrayRangeTree, KDTree]) -> SpatialIndex:
+    """Wrap a bare engine in its :class:`SpatialIndex` adapter."""
+    if isinstance(tree, SpatialIndex):
+        return tree
+    if isinstance(tree, ArrayRangeTree):
+        return ArrayRangeTreeIndex(tree)
+    if isinstance(tree, KDTree):
+        return KDTreeIndex(tree)
+    if isinstance(tree, CompactRangeTree):
+        return CompactRangeTreeIndex(tree)
+    return RangeTreeIndex(tree)
+
+
+INDEXES: Dict[str, Type[SpatialIndex]] = {
+    index.name: index
+    for index in (RangeTreeIndex, CascadingRangeTreeIndex, CompactRangeTreeIndex, ArrayRangeTreeIndex, KDTreeIndex)
+}
+
+# Engines in the order select_index prefers them: polylogarithmic queries first. The array
+# range tree is both faster and smaller than the object trees, so they are never picked.
+_PREFERENCE = (ArrayRangeTreeIndex, KDTreeIndex)
+
+
+def select_index(n: int, dimensions: int, memory_budget: Optional[int] = None) -> Type[SpatialIndex]:
+    """Pick the engine with the fastest queries whose estimated size fits ``memory_budget``.
+
+    The budget defaults to half of the available memory. When nothing fits, the kd-tree,
+    which needs the least space, is returned.
+    """
+    if memory_budget is None:
+        memory_budget = available_memory() // 2
+    for index in _PREFERENCE:
+        if index.estimate_bytes(n, dimensions) <= memory_budget:
+            return index
+    return KDTreeIndex
+
+
+def build_index(points: Sequence[Tuple], memory_budget: Optional[int] = None) -> SpatialIndex:
+    """Build the engine :func:`select_index` picks for ``points``."""
+    assert len(points)
+    return select_index(len(points), len(points[0]), memory_budget).build(points)
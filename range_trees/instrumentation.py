@@ -0,0 +1,81 @@
+"""Opt-in counters and phase timings for range tree queries.
+
+Nothing is recorded unless a query runs inside :func:`collect_stats`::
+
+    with collect_stats() as stats:
+        tree.range_count(start, end)
+    print(stats.summary())
+
+Queries are generators, so only the part of a query consumed inside the ``with`` block is
+recorded. Statistics are per thread.
+"""
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+PHASES = ("descent", "decomposition", "enumeration")
+
+_local = threading.local()
+
+
+class QueryStats:
+    """Counters and timings accumulated over the queries run while it is active.
+
+    Per-layer counters are keyed by the number of coordinates still to be searched at that
+    layer, so the innermost layer of any tree is ``1``; :meth:`per_layer` orders them from
+    the first layer down. ``canonical_nodes`` counts the nodes the one-dimensional searches
+    of every layer decompose their range into, whether the query then reports them or
+    descends into their associated trees.
+    """
+
+    def __init__(self):
+        self.nodes_visited: Dict[int, int] = {}
+        self.canonical_nodes = 0
+        self.associated_descents = 0
+        self.leaves_emitted = 0
+        self.phase_seconds: Dict[str, float] = {phase: 0.0 for phase in PHASES}
+
+    def visit(self, count: int = 1, layer: int = 1):
+        self.nodes_visited[layer] = self.nodes_visited.get(layer, 0) + count
+
+    def add_time(self, phase: str, seconds: float):
+        self.phase_seconds[phase] += seconds
+
+    def per_layer(self) -> List[int]:
+        return [self.nodes_visited[layer] for layer in sorted(self.nodes_visited, reverse=True)]
+
+    def as_dict(self) -> Dict:
+        return {
+            "nodes_visited_per_layer": self.per_layer(),
+            "canonical_nodes": self.canonical_nodes,
+            "associated_descents": self.associated_descents,
+            "leaves_emitted": self.leaves_emitted,
+            "phase_seconds": dict(self.phase_seconds),
+        }
+
+    def summary(self) -> str:
+        visited = ", ".join(f"layer {i}: {count}" for i, count in enumerate(self.per_layer()))
+        timings = ", ".join(f"{phase} {seconds * 1e3:.3f} ms" for phase, seconds in self.phase_seconds.items())
+        return (f"nodes visited ({visited or 'none'}); {self.canonical_nodes} canonical nodes; "
+                f"{self.associated_descents} associated descents; {self.leaves_emitted} leaves emitted; "
+                f"{timings}")
+
+
+def current() -> Optional[QueryStats]:
+    """The stats being collected on this thread, or ``None`` when instrumentation is off."""
+    return getattr(_local, "stats", None)
+
+
+@contextmanager
+def collect_stats(stats: Optional[QueryStats] = None) -> Iterator[QueryStats]:
+    """Record the queries run on this thread inside the block into ``stats`` (a new one by default)."""
+    if stats is None:
+        stats = QueryStats()
+    previous = current()
+    _local.stats = stats
+    try:
+        yield stats
+    finally:
+        _local.stats = previous
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from typing import Iterator, Sequence, Tuple
+
+import numpy as np
+
+from . import progress
+
+
+class KDTree:
+    """A kd-tree stored as a permutation of the point ids plus one split value per node, with O(n) space.
+
+    The tree is implicit: node ``i`` (the root is ``1``, the children of ``i`` are ``2i`` and
+    ``2i + 1``) over positions ``[lo, hi)`` of ``_order`` splits at ``mid = (lo + hi) // 2`` on
+    coordinate ``depth % d``, with the points at ``[lo, mid)`` no larger and those at
+    ``[mid, hi)`` no smaller than ``_splits[i]``. Nodes of at most ``leaf_size`` points are
+    leaves and are filtered with one vectorized comparison. A box query visits
+    O(n ** (1 - 1 / d) + k) nodes.
+    """
+
+    def __init__(self, points: np.ndarray, order: np.ndarray, splits: np.ndarray, leaf_size: int):
+        self.points = points
+        self._order = order
+        self._splits = splits
+        self.leaf_size = leaf_size
+        # The root cell, so that queries do not scan every point for it.
+        self._lower = tuple(points.min(axis=0).tolist())
+        self._upper = tuple(points.max(axis=0).tolist())
+
+    @property
+    def size(self) -> int:
+        return len(self.points)
+
+    @property
+    def dimensions(self) -> int:
+        return self.points.shape[1]
+
+    @classmethod
+    def create_from_points(cls, points: Sequence[Tuple], *, leaf_size: int = 16) -> KDTree:
+        assert len(points) and leaf_size > 0
+        points = np.asarray(points)
+        assert points.ndim == 2 and points.shape[1]
+        n, dimensions = points.shape
+        order = np.arange(n)
+        # Halving reaches leaf size after at most this many levels, which bounds the node numbers.
+        levels = max(0, -(-n // leaf_size) - 1).bit_length()
+        splits = np.zeros(1 << levels, dtype=points.dtype)
+        stack = [(1, 0, n, 0)]
+        monitor = progress.current()
+        while stack:
+            node, lo, hi, depth = stack.pop()
+            if hi - lo <= leaf_size:
+                continue
+            mid = (lo + hi) // 2
+            axis = depth % dimensions
+            if monitor is not None:
+                monitor.advance(axis, hi - lo)
+            segment = order[lo:hi]
+            segment = segment[np.argpartition(points[segment, axis], mid - lo)]
+            order[lo:hi] = segment
+            splits[node] = points[segment[mid - lo], axis]
+            stack.append((2 * node, lo, mid, depth + 1))
+            stack.append((2 * node + 1, mid, hi, depth + 1))
+        return cls(points, order, splits, leaf_size)
+
+    def _runs(self, start_point, end_point) -> Iterator[Tuple[int, int, bool]]:
+        """Yield ``(lo, hi, contained)`` runs of ``_order`` that together hold the points in the box.
+
+        Runs whose cell lies inside the box are ``contained``; the others are leaves whose
+        points still have to be filtered.
+        """
+        assert len(start_point) == len(end_point) == self.dimensions
+        dimensions = self.dimensions
+        start_point = tuple(start_point)
+        end_point = tuple(end_point)
+        # Cells are bounded by the splits on the way down, starting from the bounding box.
+        stack = [(1, 0, self.size, 0, self._lower, self._upper)]
+        while stack:
+            node, lo, hi, depth, lower, upper = stack.pop()
+            if any(l > e for l, e in zip(lower, end_point)) or any(u < s for u, s in zip(upper, start_point)):
+                continue
+            if all(s <= l for s, l in zip(start_point, lower)) and all(u <= e for u, e in zip(upper, end_point)):
+                yield lo, hi, True
+                continue
+            if hi - lo <= self.leaf_size:
+                yield lo, hi, False
+                continue
+            axis = depth % dimensions
+            mid = (lo + hi) // 2
+            split = self._splits[node].item()
+            if split <= end_point[axis]:
+                stack.append((2 * node + 1, mid, hi, depth + 1, lower[:axis] + (split,) + lower[axis + 1:], upper))
+            if start_point[axis] <= split:
+                stack.append((2 * node, lo, mid, depth + 1, lower, upper[:axis] + (split,) + upper[axis + 1:]))
+
+    def _inside(self, ids: np.ndarray, start_point, end_point) -> np.ndarray:
+        coordinates = self.points[ids]
+        return np.all((coordinates >= np.asarray(start_point)) & (coordinates <= np.asarray(end_point)), axis=1)
+
+    def canonical_runs(self, start_point, end_point) -> Iterator[np.ndarray]:
+        """Yield the ids of the points inside the box as views of covered cells and filtered leaves."""
+        for lo, hi, contained in self._runs(start_point, end_point):
+            ids = self._order[lo:hi]
+            yield ids if contained else ids[self._inside(ids, start_point, end_point)]
+
+    def range_point_indices(self, start_point, end_point) -> np.ndarray:
+        """Return the ids (rows of ``points``) of all points inside the box."""
+        found = list(self.canonical_runs(start_point, end_point))
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(found)
+
+    def range_count(self, start_point, end_point) -> int:
+        """Count the points inside the box; fully covered cells are counted without visiting their points."""
+        count = 0
+        for lo, hi, contained in self._runs(start_point, end_point):
+            if contained:
+                count += hi - lo
+            else:
+                count += int(np.count_nonzero(self._inside(self._order[lo:hi], start_point, end_point)))
+        return count
+
+    def range_point_query(self, start_point, end_point) -> Iterator[Tuple]:
+        for row in self.points[self.range_point_indices(start_point, end_point)].tolist():
+            yield tuple(row)
+
+    def batch_range_count(self, boxes) -> np.ndarray:
+        """Count the points in each of the ``(m, 2, d)`` boxes ``[[start_point, end_point], ...]``."""
+        boxes = np.asarray(boxes)
+        return np.array([self.range_count(start, end) for start, end in boxes.tolist()], dtype=np.int64)
+
+    def batch_range_query(self, boxes) -> Tuple[np.ndarray, np.ndarray]:
+        """Report the points in each of the ``(m, 2, d)`` boxes in CSR form, like :meth:`ArrayRangeTree.batch_range_query`."""
+        boxes = np.asarray(boxes)
+        found = [self.range_point_indices(start, end) for start, end in boxes.tolist()]
+        offsets = np.concatenate([[0], np.cumsum([len(ids) for ids in found], dtype=np.int64)])
+        if not found:
+            return offsets, np.empty(0, dtype=np.int64)
+        return offsets, np.concatenate(found)
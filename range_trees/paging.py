@@ -0,0 +1,140 @@
+"""Paged, chunked iteration over the points in a box.
+
+A query's result is the concatenation of its canonical pieces (last-layer subtrees, cascade
+list slices, array runs or kd-tree cells) whose sizes are known up front. A position in the result is a
+piece index plus an offset into that piece, so seeking to any offset costs a binary search
+over the pieces and one O(log n) descent by subtree size, never a scan of earlier pages.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from bisect import bisect_right
+from itertools import accumulate, islice
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .arraytree import ArrayRangeTree
+from .compact import CompactRangeTree, leaf_ids
+from .index import SpatialIndex
+from .kdtree import KDTree
+from .rangetree import TreeNode
+
+# Fetches ``count`` points of a piece after skipping the first ``skip``.
+_Fetch = Callable[[int, int], np.ndarray]
+
+
+def _tree_node_pieces(tree: TreeNode, start_point, end_point) -> Iterator[Tuple[int, _Fetch]]:
+    for piece in tree.canonical_nodes(start_point, end_point):
+        if isinstance(piece, TreeNode):
+            def fetch(skip, count, node=piece):
+                return np.array([leaf.key.point for leaf in islice(node.traverse_leaves_from(skip), count)])
+            yield piece.size, fetch
+        else:
+            cascade_list, lo, hi = piece
+
+            def fetch(skip, count, points=cascade_list.points, lo=lo):
+                return np.array(points[lo + skip:lo + skip + count])
+            yield hi - lo, fetch
+
+
+def _compact_tree_pieces(tree: CompactRangeTree, start_point, end_point) -> Iterator[Tuple[int, _Fetch]]:
+    for node in tree.canonical_nodes(start_point, end_point):
+        def fetch(skip, count, node=node):
+            return tree.points[np.fromiter(islice(leaf_ids(node, skip), count), dtype=np.int64)]
+        yield node.size, fetch
+
+
+def _array_tree_pieces(tree: Union[ArrayRangeTree, KDTree], start_point, end_point) -> Iterator[Tuple[int, _Fetch]]:
+    for ids in tree.canonical_runs(start_point, end_point):
+        def fetch(skip, count, ids=ids):
+            return tree.points[ids[skip:skip + count]]
+        yield len(ids), fetch
+
+
+def encode_cursor(piece: int, offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([piece, offset]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        piece, offset = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (TypeError, ValueError):
+        raise ValueError(f"malformed cursor {cursor!r}") from None
+    return int(piece), int(offset)
+
+
+class RangePager:
+    """Pages through the points of one box of any engine, bare or wrapped in a :class:`SpatialIndex`.
+
+    Cursors are opaque strings that stay valid for the same tree and box, so a stateless
+    server can hand one to the client and rebuild the pager on the next request.
+    """
+
+    def __init__(self, tree: Union[TreeNode, CompactRangeTree, ArrayRangeTree, KDTree, SpatialIndex],
+                 start_point, end_point):
+        if isinstance(tree, SpatialIndex):
+            tree = tree.tree
+        if isinstance(tree, (ArrayRangeTree, KDTree)):
+            pieces = list(_array_tree_pieces(tree, start_point, end_point))
+        elif isinstance(tree, CompactRangeTree):
+            pieces = list(_compact_tree_pieces(tree, start_point, end_point))
+        else:
+            pieces = list(_tree_node_pieces(tree, start_point, end_point))
+        self._sizes = [size for size, _ in pieces]
+        self._fetches: List[_Fetch] = [fetch for _, fetch in pieces]
+        self._ends = list(accumulate(self._sizes))
+
+    @property
+    def total(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    def seek(self, offset: int) -> str:
+        """Return the cursor of the point at ``offset`` in the result."""
+        offset = max(0, min(offset, self.total))
+        piece = bisect_right(self._ends, offset)
+        return encode_cursor(piece, offset - (self._ends[piece - 1] if piece else 0))
+
+    def chunks(self, chunk_size: int = 1024, cursor: Optional[str] = None) -> Iterator[Tuple[np.ndarray, str]]:
+        """Yield ``(points, cursor)`` pairs of up to ``chunk_size`` points.
+
+        Each chunk is an array with one row per point, and its cursor resumes right after it.
+        """
+        assert chunk_size > 0
+        piece, offset = decode_cursor(cursor) if cursor is not None else (0, 0)
+        while piece < len(self._sizes):
+            parts = []
+            wanted = chunk_size
+            while wanted and piece < len(self._sizes):
+                count = min(wanted, self._sizes[piece] - offset)
+                if count > 0:
+                    parts.append(self._fetches[piece](offset, count))
+                    wanted -= count
+                    offset += count
+                if offset >= self._sizes[piece]:
+                    piece, offset = piece + 1, 0
+            if parts:
+                yield np.concatenate(parts), encode_cursor(piece, offset)
+
+    def sample(self, count: int) -> np.ndarray:
+        """Return ``count`` points at evenly spaced offsets of the result (all of them if there are fewer).
+
+        Only the sampled points are fetched, each by one descent into its piece, so the cost
+        depends on ``count`` and not on the size of the result.
+        """
+        total = self.total
+        if total <= count:
+            parts = [chunk for chunk, _ in self.chunks(max(total, 1))]
+            return parts[0] if parts else np.empty((0, 0))
+        offsets = np.arange(count) * total // count
+        pieces = np.searchsorted(self._ends, offsets, "right")
+        starts = [0] + self._ends[:-1]
+        return np.concatenate([self._fetches[piece](offset - starts[piece], 1)
+                               for piece, offset in zip(pieces.tolist(), offsets.tolist())])
+
+    def page(self, offset: int = 0, limit: int = 100) -> np.ndarray:
+        """Return up to ``limit`` points starting at ``offset``, one row per point."""
+        for chunk, _ in self.chunks(limit, self.seek(offset)):
+            return chunk
+        return np.empty((0, 0))
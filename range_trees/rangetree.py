@@ -1,16 +1,53 @@
 from __future__ import annotations
 
+import math
+import operator
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass, InitVar, field
 from functools import total_ordering
-from typing import Optional, Generic, TypeVar, Any, List, Tuple, Sequence, Iterator
+from heapq import heapify, heappop, heappush
+from time import perf_counter
+from typing import Optional, Generic, TypeVar, Any, Callable, Dict, List, Tuple, Sequence, Iterator, Union
+
+from . import instrumentation, progress
+
+
+def composite_key(index: int, dimensions: int) -> Callable[[Tuple], Tuple]:
+    """A sort key ordering points like :class:`PointIndex` keys on coordinate ``index``.
+
+    Only the ``dimensions`` coordinates are compared, so payload columns never need to be comparable.
+    """
+    return operator.itemgetter(index, *range(index + 1, dimensions), *range(index))
 
 
 @total_ordering
 class PointIndex:
-    def __init__(self, point, index=0):
-        assert 0 <= index < len(point)
+    """A point as a key on coordinate ``index``.
+
+    Against plain values only that coordinate is compared, which is what box queries use.
+    Against other keys, ties on the coordinate are broken by the following coordinates, then the
+    preceding ones and finally ``id``, so duplicated points still form a strict order and
+    :meth:`TreeNode.search` finds the exact point. Columns past ``dimensions`` (all of them
+    by default) are payload and never compared. A key without an ``id`` stands for every copy
+    of its point.
+    """
+
+    def __init__(self, point, index=0, id=None, dimensions=None):
+        if dimensions is None:
+            dimensions = len(point)
+        assert 0 <= index < dimensions <= len(point)
         self.point = point
         self.index = index
+        self.id = id
+        self.dimensions = dimensions
+        self._key = None
+
+    def _composite(self) -> Tuple:
+        # Only ties on the coordinate need this, so it is built on the first one and kept.
+        if self._key is None:
+            key = composite_key(self.index, self.dimensions)(self.point)
+            self._key = key if self.dimensions > 1 else (key,)  # a single-item getter returns the item itself
+        return self._key
 
     def __getitem__(self, item):
         if type(item) is not int:
@@ -20,15 +57,197 @@ class PointIndex:
 
     def __eq__(self, other):
         if type(other) is type(self):
-            return self.point[self.index] == other.point[other.index]
+            return (self.point[self.index] == other.point[other.index]
+                    and self._composite() == other._composite()
+                    and (self.id is None or other.id is None or self.id == other.id))
         return self.point[self.index] == other
 
     def __lt__(self, other):
         if type(other) is type(self):
-            return self.point[self.index] < other.point[other.index]
+            a, b = self.point[self.index], other.point[other.index]
+            if a != b:
+                return a < b
+            a, b = self._composite(), other._composite()
+            if a != b:
+                return a < b
+            return self.id is not None and other.id is not None and self.id < other.id
         return self.point[self.index] < other
 
 
+class CascadeList:
+    """The points of a subtree sorted by one coordinate, with bridges into the children's lists.
+
+    ``left_bridge[i]`` is the number of the first ``i`` points that come from the left child, so
+    a position found in this list translates to the same position in either child in O(1).
+
+    ``aggregates`` maps each :class:`Aggregate` to a table that combines it over any slice in
+    O(1): prefix combinations for an aggregate with an ``inverse``, otherwise (for an
+    ``idempotent`` one) a sparse table whose row ``k`` combines the runs of ``2 ** k`` points.
+    For a selection such as :meth:`Aggregate.max_point` the sparse table holds the positions
+    of the selected points, so :meth:`best_position` can also say where a slice's best point is.
+    """
+
+    def __init__(self, keys: List, points: List[Tuple], left_bridge: Optional[List[int]] = None,
+                 aggregates: Sequence[Aggregate] = ()):
+        self.keys = keys
+        self.points = points
+        self.left_bridge = left_bridge
+        self.aggregates = {aggregate: self._table(aggregate) for aggregate in aggregates}
+
+    def _table(self, aggregate: Aggregate) -> List:
+        if aggregate.inverse is not None:
+            prefix = [aggregate.identity]
+            for point in self.points:
+                prefix.append(aggregate.combine(prefix[-1], aggregate.of_point(point)))
+            return prefix
+        if aggregate.column is None:
+            return self._sparse_table(list(range(len(self.points))),
+                                      lambda a, b: self._better_position(aggregate, a, b))
+        return self._sparse_table([aggregate.of_point(point) for point in self.points], aggregate.combine)
+
+    @staticmethod
+    def _sparse_table(values: List, combine: Callable[[Any, Any], Any]) -> List[List]:
+        table = [values]
+        width = 1
+        while 2 * width <= len(values):
+            row = table[-1]
+            table.append([combine(row[i], row[i + width]) for i in range(len(row) - width)])
+            width *= 2
+        return table
+
+    def _better_position(self, selection: Aggregate, a: int, b: int) -> int:
+        # A selection returns one of its arguments, the first on ties.
+        return a if selection.combine(self.points[a], self.points[b]) is self.points[a] else b
+
+    def _sparse_query(self, aggregate: Aggregate, lo: int, hi: int) -> Tuple[Any, Any]:
+        # Two runs of the largest power of two that fits cover the slice; idempotence makes the overlap harmless.
+        k = (hi - lo).bit_length() - 1
+        row = self.aggregates[aggregate][k]
+        return row[lo], row[hi - (1 << k)]
+
+    def best_position(self, selection: Aggregate, lo: int, hi: int) -> int:
+        """The position of the point ``selection`` picks from the non-empty ``points[lo:hi]``, in O(1)."""
+        return self._better_position(selection, *self._sparse_query(selection, lo, hi))
+
+    def aggregate(self, aggregate: Aggregate, lo: int, hi: int):
+        """Combine ``aggregate`` over ``points[lo:hi]``."""
+        table = self.aggregates[aggregate]
+        if hi <= lo:
+            return aggregate.identity
+        if aggregate.inverse is not None:
+            return aggregate.inverse(table[hi], table[lo])
+        if aggregate.column is None:
+            return self.points[self.best_position(aggregate, lo, hi)]
+        return aggregate.combine(*self._sparse_query(aggregate, lo, hi))
+
+    def __len__(self):
+        return len(self.points)
+
+    def __repr__(self):
+        return f"CascadeList({self.keys})"
+
+    @classmethod
+    def create_leaf(cls, point: Tuple, index: int, aggregates: Sequence[Aggregate] = ()) -> CascadeList:
+        return cls([point[index]], [point], aggregates=aggregates)
+
+    @classmethod
+    def merge(cls, left: CascadeList, right: CascadeList, aggregates: Sequence[Aggregate] = ()) -> CascadeList:
+        keys, points, left_bridge = [], [], [0]
+        i = j = 0
+        while i < len(left) or j < len(right):
+            if j == len(right) or (i < len(left) and left.keys[i] <= right.keys[j]):
+                keys.append(left.keys[i])
+                points.append(left.points[i])
+                i += 1
+            else:
+                keys.append(right.keys[j])
+                points.append(right.points[j])
+                j += 1
+            left_bridge.append(i)
+        return cls(keys, points, left_bridge, aggregates)
+
+
+@dataclass(frozen=True)
+class _Better:
+    """Picks whichever of two points has the larger (or smaller) ``column``; ties keep the first."""
+    column: int
+    largest: bool
+
+    def __call__(self, a: Optional[Tuple], b: Optional[Tuple]) -> Optional[Tuple]:
+        if a is None:
+            return b
+        if b is None:
+            return a
+        if self.largest:
+            return b if b[self.column] > a[self.column] else a
+        return b if b[self.column] < a[self.column] else a
+
+
+@dataclass(frozen=True)
+class Aggregate:
+    """An associative summary of one point column, precomputed at every node of the last layer.
+
+    With ``column`` set to ``None`` the summary is over whole points, as for the selections
+    :meth:`max_point` and :meth:`min_point` used by :meth:`TreeNode.range_top_k`.
+
+    Trees built with ``cascade=True`` also need either an ``inverse`` (``inverse(combine(a, b), a) == b``)
+    or an ``idempotent`` combine (``combine(a, a) == a``) to summarize cascade list slices in O(1).
+    """
+    column: Optional[int]
+    combine: Callable[[Any, Any], Any]
+    identity: Any = None
+    inverse: Optional[Callable[[Any, Any], Any]] = None
+    idempotent: bool = False
+
+    @classmethod
+    def sum(cls, column: int) -> Aggregate:
+        return cls(column, operator.add, 0, inverse=operator.sub)
+
+    @classmethod
+    def min(cls, column: int) -> Aggregate:
+        return cls(column, min, math.inf, idempotent=True)
+
+    @classmethod
+    def max(cls, column: int) -> Aggregate:
+        return cls(column, max, -math.inf, idempotent=True)
+
+    @classmethod
+    def max_point(cls, column: int) -> Aggregate:
+        """The point with the largest ``column``."""
+        return cls(None, _Better(column, largest=True), idempotent=True)
+
+    @classmethod
+    def min_point(cls, column: int) -> Aggregate:
+        """The point with the smallest ``column``."""
+        return cls(None, _Better(column, largest=False), idempotent=True)
+
+    def of_point(self, point: Tuple) -> Any:
+        return point if self.column is None else point[self.column]
+
+
+class _Candidate:
+    """A heap entry of :meth:`TreeNode.range_top_k`: the best point of ``node``.
+
+    ``node`` is a last-layer :class:`TreeNode`, or a cascade list slice ``(cascade_list, lo,
+    position, hi)`` whose best point is at ``position``.
+    """
+    __slots__ = ("best", "node", "better")
+
+    def __init__(self, best: Tuple, node: Union[TreeNode, Tuple[CascadeList, int, int, int]],
+                 better: Callable[[Any, Any], Any]):
+        self.best = best
+        self.node = node
+        self.better = better
+
+    def __lt__(self, other: _Candidate) -> bool:
+        return self.better(self.best, other.best) is self.best
+
+    @classmethod
+    def of_slice(cls, cascade_list: CascadeList, lo: int, hi: int, key: Aggregate) -> _Candidate:
+        position = cascade_list.best_position(key, lo, hi)
+        return cls(cascade_list.points[position], (cascade_list, lo, position, hi), key.combine)
+
+
 K = TypeVar("K")
 V = TypeVar("V")
 
@@ -44,6 +263,7 @@ class TreeNode(Generic[K, V]):
     key: K = field(init=False)
     min: K = field(init=False)
     max: K = field(init=False)
+    aggregates: Dict[Aggregate, Any] = field(default_factory=dict, compare=False, repr=False)
 
     def __post_init__(self, _key: Optional[K]):
         if _key is not None:
@@ -63,21 +283,24 @@ class TreeNode(Generic[K, V]):
             return f"Node({self.left}, {self.right})"
 
     @classmethod
-    def create_leaf(cls, key, value=None) -> TreeNode[K]:
-        return cls(_key=key, value=value)
+    def create_leaf(cls, key, value=None, aggregates: Sequence[Aggregate] = ()) -> TreeNode[K]:
+        return cls(_key=key, value=value, aggregates={a: a.of_point(key.point) for a in aggregates})
 
     @classmethod
     def create_internal(cls, left: TreeNode, right: TreeNode, value=None) -> TreeNode[K]:
-        return cls(is_leaf=False, left=left, right=right, value=value, size=left.size + right.size)
+        aggregates = {a: a.combine(v, right.aggregates[a]) for a, v in left.aggregates.items()}
+        return cls(is_leaf=False, left=left, right=right, value=value, size=left.size + right.size,
+                   aggregates=aggregates)
 
     @classmethod
-    def create_from_sorted_list(cls, keys: Sequence[K], values: Optional[Sequence[V]] = None) -> TreeNode[K]:
+    def create_from_sorted_list(cls, keys: Sequence[K], values: Optional[Sequence[V]] = None,
+                                aggregates: Sequence[Aggregate] = ()) -> TreeNode[K]:
         assert keys
         if values is not None:
             assert len(values) == len(keys)
         else:
             values = [None] * len(keys)
-        nodes: List[TreeNode[K]] = [cls.create_leaf(k, v) for k, v in zip(keys, values)]
+        nodes: List[TreeNode[K]] = [cls.create_leaf(k, v, aggregates) for k, v in zip(keys, values)]
         while len(nodes) > 1:
             new_nodes = [TreeNode.create_internal(nodes[i], nodes[i + 1]) for i in range(0, len(nodes) - 1, 2)]
             if len(nodes) % 2 != 0:
@@ -86,16 +309,91 @@ class TreeNode(Generic[K, V]):
         return nodes[0]
 
     @classmethod
-    def create_from_points(cls, points: Sequence[Tuple[K, ...]], index: int = 0):
+    def create_from_points(cls, points: Sequence[Tuple[K, ...]], index: int = 0, *,
+                           dimensions: Optional[int] = None, cascade: bool = False,
+                           aggregates: Sequence[Aggregate] = ()):
+        """Build a range tree over coordinates ``index`` to ``dimensions - 1`` of ``points``.
+
+        ``dimensions`` defaults to the length of the points; any further columns are carried
+        along as payload, e.g. as the value column of an :class:`Aggregate`. The ``aggregates``
+        are precomputed at every node of the last layer for :meth:`range_aggregate`.
+
+        With ``cascade``, the last two coordinates use a layered tree with fractional cascading:
+        instead of a tree on the last coordinate, each node stores a :class:`CascadeList`, and
+        every aggregate needs an ``inverse`` or must be ``idempotent``.
+        """
         assert points
-        assert len(points[0])
-        indexed_points = sorted(PointIndex(point=p, index=index) for p in points)
-        root = cls.create_from_sorted_list(indexed_points)
-        if index + 1 < len(points[0]):
-            for node in root.traverse_all():
-                new_keys = [leaf.key.point for leaf in node.traverse_leaves()]
-                object.__setattr__(node, 'value', cls.create_from_points(new_keys, index=index+1))
-        return root
+        if dimensions is None:
+            dimensions = len(points[0])
+        assert 0 <= index < dimensions <= len(points[0])
+        if cascade and index + 2 <= dimensions:
+            for aggregate in aggregates:
+                if aggregate.inverse is None and not aggregate.idempotent:
+                    raise ValueError(f"{aggregate} has neither an inverse nor an idempotent combine, "
+                                     "so cascade lists cannot summarize it")
+        # Every layer orders the points by its composite key, ties broken by input position, which
+        # also becomes each key's id. Ranking them once here lets the layers below merge by rank.
+        ranks = []
+        for layer in range(index, dimensions):
+            keys = list(map(composite_key(layer, dimensions), points))
+            order = sorted(range(len(points)), key=keys.__getitem__)
+            if layer == index:
+                ids = order
+            else:
+                rank = [0] * len(points)
+                for position, i in enumerate(order):
+                    rank[i] = position
+                ranks.append(rank)
+        with progress.collection_paused():
+            return cls._create_from_presorted(points, ids, ranks, index, dimensions, cascade, aggregates)
+
+    @classmethod
+    def _create_from_presorted(cls, points: Sequence[Tuple[K, ...]], ids: List[int], ranks: List[List[int]],
+                               index: int, dimensions: int, cascade: bool,
+                               aggregates: Sequence[Aggregate]) -> TreeNode[K]:
+        """Build a layer over ``points[i] for i in ids``, with ``ids`` already sorted by coordinate ``index``.
+
+        ``ranks[j][i]`` is the position of ``points[i]`` in the order of layer ``index + 1 + j``.
+        Like merge sort, each node's ids sorted for the next layer come from merging its
+        children's lists, so no layer below the first ever sorts again and construction takes
+        O(n log^(d-1) n).
+        """
+        last = index + 1 == dimensions
+        cascaded = cascade and index + 2 == dimensions
+        next_rank = ranks[0].__getitem__ if ranks else None
+        monitor = progress.current()
+
+        def build(lo: int, hi: int):
+            if hi - lo == 1:
+                point = points[ids[lo]]
+                key = PointIndex(point, index, ids[lo], dimensions)
+                if monitor is not None:
+                    monitor.advance(index)
+                if last:
+                    return cls.create_leaf(key, aggregates=aggregates), None
+                if cascaded:
+                    cascade_list = CascadeList.create_leaf(point, index + 1, aggregates)
+                    if monitor is not None:
+                        monitor.advance(index + 1)
+                    return cls.create_leaf(key, cascade_list), cascade_list
+                value = cls._create_from_presorted(points, ids[lo:hi], ranks[1:], index + 1, dimensions,
+                                                   cascade, aggregates)
+                return cls.create_leaf(key, value), ids[lo:hi]
+            mid = (lo + hi) // 2
+            left, left_sorted = build(lo, mid)
+            right, right_sorted = build(mid, hi)
+            if last:
+                return cls.create_internal(left, right), None
+            if cascaded:
+                cascade_list = CascadeList.merge(left_sorted, right_sorted, aggregates)
+                if monitor is not None:
+                    monitor.advance(index + 1, len(cascade_list))
+                return cls.create_internal(left, right, cascade_list), cascade_list
+            merged = sorted(left_sorted + right_sorted, key=next_rank)  # timsort merges the two runs
+            value = cls._create_from_presorted(points, merged, ranks[1:], index + 1, dimensions, cascade, aggregates)
+            return cls.create_internal(left, right, value), merged
+
+        return build(0, len(ids))[0]
 
     def search(self, key: K, *, path: Optional[List] = None) -> Optional[TreeNode[K]]:
         if path is not None:
@@ -168,43 +466,252 @@ class TreeNode(Generic[K, V]):
 
     # TODO: similar to pred/succ; can some of the special cases be removed?
     def range_query(self, start: K, end: K) -> Iterator[TreeNode[K, V]]:
+        stats = instrumentation.current()
+        if stats is not None:
+            begin = perf_counter()
         pred_path = []
         succ_path = []
         pred_result = self.pred(start, path=pred_path)
         succ_result = self.succ(end, path=succ_path)
-        if pred_result is None and succ_result is None:
-            yield self  # The entire tree is within the range; this handles the one element case as well
+        if stats is None:
+            yield from self._split_paths(start, end, pred_path, pred_result, succ_path, succ_result)
             return
+        descended = perf_counter()
+        stats.visit(len(pred_path) + len(succ_path), self._layers())
+        stats.add_time("descent", descended - begin)
+        nodes = self._split_paths(start, end, pred_path, pred_result, succ_path, succ_result)
+        stats.add_time("decomposition", perf_counter() - descended)
+        for node in nodes:
+            stats.canonical_nodes += 1
+            yield node
+
+    def _layers(self) -> int:
+        """The number of coordinates searched from this node's layer down, ``1`` in the last layer."""
+        node, layers = self, 1
+        while isinstance(node.value, TreeNode):
+            node, layers = node.value, layers + 1
+        return layers + isinstance(node.value, CascadeList)
+
+    def _split_paths(self, start: K, end: K, pred_path: List[TreeNode[K, V]], pred_result: Optional[TreeNode[K, V]],
+                     succ_path: List[TreeNode[K, V]], succ_result: Optional[TreeNode[K, V]]) -> List[TreeNode[K, V]]:
+        if pred_result is None and succ_result is None:
+            return [self]  # The entire tree is within the range; this handles the one element case as well
         split_idx = None  # First index where pred_path is different from succ_path
         for i, (pred_node, succ_node) in enumerate(zip(pred_path, succ_path)):
             if pred_node is not succ_node:
                 split_idx = i
                 break
         if split_idx is None:
-            return
+            return []
+        nodes = []
         if pred_result is None:
             assert pred_path[-1].key >= start
-            yield pred_path[-1]
+            nodes.append(pred_path[-1])
         for i in reversed(range(split_idx, len(pred_path) - 1)):
             if pred_path[i].left is pred_path[i + 1]:
-                yield pred_path[i].right
+                nodes.append(pred_path[i].right)
         for i in range(split_idx, len(succ_path) - 1):
             if succ_path[i].right is succ_path[i + 1]:
-                yield succ_path[i].left
+                nodes.append(succ_path[i].left)
         if succ_result is None:
             assert succ_path[-1].key <= end
-            yield succ_path[-1]
+            nodes.append(succ_path[-1])
+        return nodes
 
-    def range_point_query(self, start_point, end_point):
+    def _cascade_query(self, start: K, end: K, lo: int, hi: int,
+                       stats: Optional[instrumentation.QueryStats] = None) -> Iterator[Tuple[CascadeList, int, int]]:
+        """Yield ``(list, lo, hi)`` slices of the canonical nodes' cascade lists for keys in ``[start, end]``.
+
+        ``lo`` and ``hi`` are positions in this node's cascade list; they are carried to the
+        children through the bridges instead of searching each child's list again.
+        """
+        if stats is not None:
+            stats.visit(layer=2)  # the layer holding the cascade lists searches two coordinates
+        if lo >= hi or self.max < start or end < self.min:
+            return
+        if start <= self.min and self.max <= end:
+            if stats is not None:
+                stats.canonical_nodes += 1
+            yield self.value, lo, hi
+            return
+        assert not self.is_leaf  # a leaf is either inside or outside the range
+        bridge = self.value.left_bridge
+        yield from self.left._cascade_query(start, end, bridge[lo], bridge[hi], stats)
+        yield from self.right._cascade_query(start, end, lo - bridge[lo], hi - bridge[hi], stats)
+
+    def canonical_nodes(self, start_point, end_point) -> Iterator[Union[TreeNode[K, V], Tuple[CascadeList, int, int]]]:
+        """Yield the last-layer pieces whose points are exactly those inside the box.
+
+        A piece is a canonical subtree of the last layer, or a ``(list, lo, hi)`` slice of a
+        cascade list when the tree was built with ``cascade``.
+        """
         assert len(start_point) == len(end_point)
+        stats = instrumentation.current()
+        if isinstance(self.value, CascadeList):
+            assert len(start_point) == 2
+            keys = self.value.keys
+            lo, hi = bisect_left(keys, start_point[1]), bisect_right(keys, end_point[1])
+            yield from self._cascade_query(start_point[0], end_point[0], lo, hi, stats)
+            return
         start_first, *start_point = start_point
         end_first, *end_point = end_point
         query_result = self.range_query(start_first, end_first)
         for node in query_result:
             if not start_point:
-                yield from (leaf.key.point for leaf in node.traverse_leaves())
+                yield node
+            else:
+                if stats is not None:
+                    stats.associated_descents += 1
+                yield from node.value.canonical_nodes(start_point, end_point)
+
+    def range_point_query(self, start_point, end_point):
+        for node in self.canonical_nodes(start_point, end_point):
+            if isinstance(node, TreeNode):
+                points = (leaf.key.point for leaf in node.traverse_leaves())
+            else:
+                cascade_list, lo, hi = node
+                points = cascade_list.points[lo:hi]
+            stats = instrumentation.current()
+            if stats is not None:
+                # Materialize the piece so the timing covers only the enumeration, not the consumer.
+                begin = perf_counter()
+                points = list(points)
+                stats.add_time("enumeration", perf_counter() - begin)
+                stats.leaves_emitted += len(points)
+            yield from points
+
+    def range_count(self, start_point, end_point) -> int:
+        """Count the points inside the box without enumerating them."""
+        count = 0
+        for node in self.canonical_nodes(start_point, end_point):
+            if isinstance(node, TreeNode):
+                count += node.size
             else:
-                yield from node.value.range_point_query(start_point, end_point)
+                _, lo, hi = node
+                count += hi - lo
+        return count
+
+    def range_aggregate(self, start_point, end_point, aggregate: Aggregate):
+        """Combine ``aggregate`` over the points inside the box.
+
+        The aggregate must have been passed to :meth:`create_from_points`. Slices of cascade
+        lists are combined in O(1) from the tables each list keeps.
+        """
+        result = aggregate.identity
+        for node in self.canonical_nodes(start_point, end_point):
+            table = node.aggregates if isinstance(node, TreeNode) else node[0].aggregates
+            if aggregate not in table:
+                raise ValueError(f"{aggregate} was not precomputed when the tree was built")
+            if isinstance(node, TreeNode):
+                result = aggregate.combine(result, node.aggregates[aggregate])
+            else:
+                cascade_list, lo, hi = node
+                result = aggregate.combine(result, cascade_list.aggregate(aggregate, lo, hi))
+        return result
+
+    def range_diff(self, old_start, old_end, new_start, new_end) -> Tuple[List[Tuple], List[Tuple]]:
+        """Return ``(entered, left)``: the points inside the new box but not the old one, and the reverse.
+
+        Both boxes are searched in one descent. Subtrees that both boxes cover on a layer's
+        coordinate are diffed on the next layer (or skipped on the last one), and subtrees
+        that neither box reaches are skipped, so the work follows the points that changed
+        rather than the points in the boxes.
+        """
+        assert len(old_start) == len(old_end) == len(new_start) == len(new_end)
+        entered: List[Tuple] = []
+        left: List[Tuple] = []
+        self._diff((tuple(old_start), tuple(old_end)), (tuple(new_start), tuple(new_end)), entered, left)
+        return entered, left
+
+    def _cover(self, start: K, end: K) -> int:
+        """``0`` if no key of the subtree is in ``[start, end]``, ``2`` if all of them are, else ``1``."""
+        if self.max < start or end < self.min:
+            return 0
+        return 2 if start <= self.min and self.max <= end else 1
+
+    def _diff(self, old_box: Tuple[Tuple, Tuple], new_box: Tuple[Tuple, Tuple], entered: List[Tuple],
+              left: List[Tuple]):
+        old = self._cover(old_box[0][0], old_box[1][0])
+        new = self._cover(new_box[0][0], new_box[1][0])
+        if old == new == 0:
+            return
+        if old == new == 2:
+            self._diff_next(old_box, new_box, entered, left)
+        elif old == 2 and new == 0:
+            left.extend(self._report_next(old_box))
+        elif old == 0 and new == 2:
+            entered.extend(self._report_next(new_box))
+        else:
+            assert not self.is_leaf  # a leaf is either inside or outside the range
+            self.left._diff(old_box, new_box, entered, left)
+            self.right._diff(old_box, new_box, entered, left)
+
+    def _report_next(self, box: Tuple[Tuple, Tuple]) -> Iterator[Tuple]:
+        """The points of this subtree inside the box on the coordinates after this layer's."""
+        start, end = box[0][1:], box[1][1:]
+        if not start:
+            return (leaf.key.point for leaf in self.traverse_leaves())
+        if isinstance(self.value, CascadeList):
+            keys = self.value.keys
+            return iter(self.value.points[bisect_left(keys, start[0]):bisect_right(keys, end[0])])
+        return self.value.range_point_query(start, end)
+
+    def _diff_next(self, old_box: Tuple[Tuple, Tuple], new_box: Tuple[Tuple, Tuple], entered: List[Tuple],
+                   left: List[Tuple]):
+        """Diff the boxes on the coordinates after this layer's, which both boxes fully cover."""
+        old_box = old_box[0][1:], old_box[1][1:]
+        new_box = new_box[0][1:], new_box[1][1:]
+        if not old_box[0]:
+            return
+        if isinstance(self.value, CascadeList):
+            keys, points = self.value.keys, self.value.points
+            old_lo = bisect_left(keys, old_box[0][0])
+            old_hi = max(old_lo, bisect_right(keys, old_box[1][0]))
+            new_lo = bisect_left(keys, new_box[0][0])
+            new_hi = max(new_lo, bisect_right(keys, new_box[1][0]))
+            # Each slice minus the other is what is left of it below and above the other.
+            left.extend(points[old_lo:min(old_hi, new_lo)] + points[max(old_lo, new_hi):old_hi])
+            entered.extend(points[new_lo:min(new_hi, old_lo)] + points[max(new_lo, old_hi):new_hi])
+            return
+        self.value._diff(old_box, new_box, entered, left)
+
+    def range_top_k(self, start_point, end_point, k: int, key: Aggregate) -> List[Tuple]:
+        """Return the (up to) ``k`` points inside the box that ``key`` selects first, best first.
+
+        ``key`` is a selection such as ``Aggregate.max_point(column)`` and must have been passed
+        to :meth:`create_from_points`, so every last-layer node knows its best point. The best
+        points of the canonical nodes go into a heap; popping an internal node pushes its two
+        children instead, so the cost is O(log^d n + k log n) however many points the box holds.
+        A cascade list slice enters with its best point, found in O(1) from the list's table;
+        popping it splits the slice around that point.
+        """
+        candidates = []
+        for node in self.canonical_nodes(start_point, end_point):
+            table = node.aggregates if isinstance(node, TreeNode) else node[0].aggregates
+            if key not in table:
+                raise ValueError(f"{key} was not precomputed when the tree was built")
+            if isinstance(node, TreeNode):
+                candidates.append(_Candidate(node.aggregates[key], node, key.combine))
+            else:
+                candidates.append(_Candidate.of_slice(*node, key))
+        heapify(candidates)
+        result = []
+        while candidates and len(result) < k:
+            candidate = heappop(candidates)
+            node = candidate.node
+            if not isinstance(node, TreeNode):
+                result.append(candidate.best)
+                cascade_list, lo, position, hi = node
+                if lo < position:
+                    heappush(candidates, _Candidate.of_slice(cascade_list, lo, position, key))
+                if position + 1 < hi:
+                    heappush(candidates, _Candidate.of_slice(cascade_list, position + 1, hi, key))
+            elif node.is_leaf:
+                result.append(candidate.best)
+            else:
+                heappush(candidates, _Candidate(node.left.aggregates[key], node.left, key.combine))
+                heappush(candidates, _Candidate(node.right.aggregates[key], node.right, key.combine))
+        return result
 
     def traverse_leaves(self) -> Iterator[TreeNode[K, V]]:
         if self.is_leaf:
@@ -213,10 +720,22 @@ class TreeNode(Generic[K, V]):
             yield from self.left.traverse_leaves()
             yield from self.right.traverse_leaves()
 
+    def traverse_leaves_from(self, rank: int) -> Iterator[TreeNode[K, V]]:
+        """Yield the leaves after skipping the first ``rank``, finding the first one in O(log n) by subtree size."""
+        if rank >= self.size:
+            return
+        if self.is_leaf:
+            yield self
+        elif rank < self.left.size:
+            yield from self.left.traverse_leaves_from(rank)
+            yield from self.right.traverse_leaves()
+        else:
+            yield from self.right.traverse_leaves_from(rank - self.left.size)
+
     def traverse_all(self) -> Iterator[TreeNode[K, V]]:
         if self.is_leaf:
             yield self
         else:
-            yield from self.left.traverse_leaves()
+            yield from self.left.traverse_all()
             yield self
-            yield from self.right.traverse_leaves()
+            yield from self.right.traverse_all()
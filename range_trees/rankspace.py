@@ -0,0 +1,87 @@
+"""Rank-space reduction: range trees over dense integer ranks instead of raw coordinates.
+
+Each coordinate of each point is replaced by the point's position in the order of that
+coordinate (ties broken as :class:`PointIndex` does), so every layer's keys are the distinct
+integers ``0 .. n - 1`` however duplicated the input is, and every comparison during a query
+is between small ints. Coordinates only need to be ordered, so strings, dates or decimals work
+as well as numbers. A query box is translated to rank ranges once, with one binary search per
+bound.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .rangetree import TreeNode, composite_key
+
+
+class RankSpaceTree:
+    """A range tree built by ``engine`` over the rank tuples of ``points``.
+
+    ``engine`` is any class with ``create_from_points``, ``range_count`` and
+    ``range_point_query``, such as :class:`TreeNode` (the default) or :class:`ArrayRangeTree`;
+    extra keyword arguments go to its ``create_from_points``.
+    """
+
+    def __init__(self, points: List[Tuple], values: List[List], ids: List[int], tree: Any):
+        self.points = points
+        self._values = values
+        self._ids = ids
+        self.tree = tree
+
+    @property
+    def size(self) -> int:
+        return len(self.points)
+
+    @property
+    def dimensions(self) -> int:
+        return len(self._values)
+
+    @classmethod
+    def create_from_points(cls, points: Sequence[Tuple], *, dimensions: Optional[int] = None,
+                           engine=TreeNode, **options) -> RankSpaceTree:
+        """Rank coordinates ``0`` to ``dimensions - 1`` of ``points``; further columns are kept as payload."""
+        assert points
+        points = [tuple(point) for point in points]
+        if dimensions is None:
+            dimensions = len(points[0])
+        n = len(points)
+        values: List[List] = []
+        ranks = [[0] * dimensions for _ in range(n)]
+        ids: List[int] = []
+        for index in range(dimensions):
+            key = composite_key(index, dimensions)
+            order = sorted(range(n), key=lambda i: key(points[i]))
+            values.append([points[i][index] for i in order])
+            for rank, i in enumerate(order):
+                ranks[i][index] = rank
+            if index == 0:
+                ids = order
+        tree = engine.create_from_points([tuple(rank) for rank in ranks], **options)
+        return cls(points, values, ids, tree)
+
+    def rank_box(self, start_point, end_point) -> Optional[Tuple[Tuple[int, ...], Tuple[int, ...]]]:
+        """Translate a box to the rank box holding the same points, or ``None`` if it is empty."""
+        assert len(start_point) == len(end_point) == self.dimensions
+        start = tuple(bisect_left(values, s) for values, s in zip(self._values, start_point))
+        end = tuple(bisect_right(values, e) - 1 for values, e in zip(self._values, end_point))
+        if any(s > e for s, e in zip(start, end)):
+            return None
+        return start, end
+
+    def range_point_indices(self, start_point, end_point) -> np.ndarray:
+        """Return the positions in ``points`` of all points inside the box."""
+        box = self.rank_box(start_point, end_point)
+        if box is None:
+            return np.empty(0, dtype=np.int64)
+        return np.fromiter((self._ids[ranks[0]] for ranks in self.tree.range_point_query(*box)), dtype=np.int64)
+
+    def range_count(self, start_point, end_point) -> int:
+        box = self.rank_box(start_point, end_point)
+        return self.tree.range_count(*box) if box is not None else 0
+
+    def range_point_query(self, start_point, end_point) -> Iterator[Tuple]:
+        for i in self.range_point_indices(start_point, end_point).tolist():
+            yield self.points[i]
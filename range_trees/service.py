@@ -0,0 +1,122 @@
+"""A query service that owns a range tree, rebuilds it in the background and serves queries concurrently.
+
+Readers always see one consistent ``(tree, version)`` snapshot: a rebuild constructs the new
+tree on a build thread and replaces the snapshot with a single assignment once it is done,
+so queries in flight keep using the old tree until they finish.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+from .cache import QueryCache
+from .index import as_index
+from .rangetree import TreeNode
+
+T = TypeVar("T")
+
+
+class RangeTreeService:
+    """Serves box queries from a thread pool while rebuilds run on a separate build thread.
+
+    ``build`` turns a list of points into a tree (``TreeNode.create_from_points`` by default).
+    Every method returns a :class:`concurrent.futures.Future`; wait with ``result(timeout)``,
+    call ``cancel()`` to drop work that has not started, or use the ``*_async`` variants from
+    asyncio code.
+    """
+
+    def __init__(self, tree: Any, *, build: Callable[[Sequence[Tuple]], Any] = TreeNode.create_from_points,
+                 query_workers: int = 4, cache: Optional[QueryCache] = None):
+        self._snapshot = (tree, 0)
+        self._build = build
+        self._cache = cache
+        self._query_executor = ThreadPoolExecutor(query_workers, thread_name_prefix="range-query")
+        self._build_executor = ThreadPoolExecutor(1, thread_name_prefix="range-build")
+        self._build_lock = threading.Lock()
+        self._pending_build: Optional[Future] = None
+        self._pending_builder: Optional[Callable[[Sequence[Tuple]], Any]] = None
+        self._requested_version = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self, wait: bool = True):
+        self._build_executor.shutdown(wait=wait)
+        self._query_executor.shutdown(wait=wait)
+
+    @property
+    def snapshot(self) -> Tuple[Any, int]:
+        """The current ``(tree, version)``."""
+        return self._snapshot
+
+    @property
+    def building(self) -> bool:
+        pending = self._pending_build
+        return pending is not None and not pending.done()
+
+    def rebuild(self, points: Sequence[Tuple], build: Optional[Callable[[Sequence[Tuple]], Any]] = None) -> Future:
+        """Build a tree over ``points`` in the background and swap it in; the future yields its version.
+
+        ``build`` overrides the service's build function for this rebuild only. A rebuild that
+        has not started yet when a newer one is requested is cancelled, since its tree would be
+        replaced right away. One already running is stopped too if its build function has a
+        ``cancel`` method, like :class:`~range_trees.builder.TreeBuilder`; its future then
+        raises :class:`~range_trees.progress.BuildCancelled`.
+        """
+        build = build or self._build
+        with self._build_lock:
+            if self._pending_build is not None:
+                self._pending_build.cancel()
+                # A builder reused for the new rebuild must not be left cancelled.
+                cancel = getattr(self._pending_builder, "cancel", None)
+                if cancel is not None and self._pending_builder is not build and not self._pending_build.done():
+                    cancel()
+            self._requested_version += 1
+            future = self._build_executor.submit(self._run_build, build, list(points), self._requested_version)
+            self._pending_build = future
+            self._pending_builder = build
+        return future
+
+    def _run_build(self, build: Callable[[Sequence[Tuple]], Any], points: Sequence[Tuple], version: int) -> int:
+        tree = build(points)
+        self._snapshot = (tree, version)
+        return version
+
+    def submit(self, query: Callable[[Any, int], T]) -> Future:
+        """Run ``query(tree, version)`` on a query thread against the snapshot current at submission."""
+        tree, version = self._snapshot
+        return self._query_executor.submit(query, tree, version)
+
+    def count(self, start_point, end_point) -> Future:
+        tree, version = self._snapshot
+        if self._cache is not None:
+            return self._query_executor.submit(self._cache.count, tree, start_point, end_point, version)
+        return self._query_executor.submit(as_index(tree).count, start_point, end_point)
+
+    def points(self, start_point, end_point) -> Future:
+        """Return the points inside the box as an array with one row per point."""
+        tree, version = self._snapshot
+        if self._cache is not None:
+            return self._query_executor.submit(self._cache.points, tree, start_point, end_point, version)
+        return self._query_executor.submit(as_index(tree).report, start_point, end_point)
+
+    @staticmethod
+    async def _await(future: Future, timeout: Optional[float]):
+        # On timeout, wait_for cancels the wrapper, which cancels the future if it has not started.
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    async def count_async(self, start_point, end_point, timeout: Optional[float] = None) -> int:
+        return await self._await(self.count(start_point, end_point), timeout)
+
+    async def points_async(self, start_point, end_point, timeout: Optional[float] = None) -> np.ndarray:
+        return await self._await(self.points(start_point, end_point), timeout)
+
+    async def rebuild_async(self, points: Sequence[Tuple], timeout: Optional[float] = None) -> int:
+        return await self._await(self.rebuild(points), timeout)
@@ -0,0 +1,109 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from range_trees.arraytree import ArrayRangeTree, canonical_blocks
+from range_trees.rangetree import TreeNode
+
+
+class TestArrayRangeTree(unittest.TestCase):
+
+    def test_canonical_blocks(self):
+        for start in range(0, 40):
+            for end in range(start, 41):
+                blocks = canonical_blocks(start, end)
+                covered = [p for b in blocks for p in range(b.start, b.start + b.size)]
+                self.assertEqual(covered, list(range(start, end)))
+                for b in blocks:
+                    self.assertEqual(b.start % b.size, 0)
+
+    def test_range_query(self):
+        for num in [1, 2, 10, 17, 127]:
+            keys = list(range(0, num * 2, 2))
+            tree = ArrayRangeTree.create_from_points([(k,) for k in keys])
+            for start in range(-1, num * 2 + 1):
+                for end in range(start, num * 2 + 2):
+                    expected_count = len([k for k in keys if start <= k <= end])
+                    self.assertEqual(sum(b.size for b in tree.range_query(start, end)), expected_count)
+
+    def test_matches_tree_node(self):
+        rng = random.Random(6851)
+        for dimensions in [1, 2, 3]:
+            for num in [1, 5, 33, 100]:
+                points = [tuple(rng.randint(-6, 6) for _ in range(dimensions)) for _ in range(num)]
+                tree = TreeNode.create_from_points(points)
+                array_tree = ArrayRangeTree.create_from_points(points)
+                for _ in range(30):
+                    start = tuple(rng.randint(-7, 7) for _ in range(dimensions))
+                    end = tuple(s + rng.randint(0, 8) for s in start)
+                    self.assertEqual(sorted(array_tree.range_point_query(start, end)),
+                                     sorted(tree.range_point_query(start, end)))
+
+    def test_float_coordinates(self):
+        rng = random.Random(3)
+        points = [(rng.random(), rng.random()) for _ in range(200)]
+        tree = ArrayRangeTree.create_from_points(points)
+        ids = tree.range_point_indices((0.25, 0.1), (0.75, 0.6))
+        expected = [i for i, (x, y) in enumerate(points) if 0.25 <= x <= 0.75 and 0.1 <= y <= 0.6]
+        self.assertEqual(sorted(ids.tolist()), expected)
+
+    def test_batch_queries(self):
+        rng = np.random.RandomState(851)
+        for dimensions in [1, 2, 3]:
+            for num in [1, 7, 150]:
+                points = rng.randint(-10, 10, (num, dimensions))
+                tree = ArrayRangeTree.create_from_points(points)
+                starts = rng.randint(-12, 12, (200, dimensions))
+                boxes = np.stack([starts, starts + rng.randint(-2, 12, (200, dimensions))], axis=1)
+                counts = tree.batch_range_count(boxes)
+                offsets, indices = tree.batch_range_query(boxes)
+                self.assertEqual(offsets.tolist(), [0] + np.cumsum(counts).tolist())
+                for i, (start, end) in enumerate(boxes):
+                    expected = tree.range_point_indices(start, end)
+                    self.assertEqual(counts[i], len(expected))
+                    self.assertEqual(sorted(indices[offsets[i]:offsets[i + 1]].tolist()), sorted(expected.tolist()))
+
+    def test_save_load(self):
+        rng = np.random.RandomState(8)
+        points = rng.randint(-20, 20, (300, 3))
+        tree = ArrayRangeTree.create_from_points(points)
+        boxes = np.stack([np.full((50, 3), -5), rng.randint(-5, 15, (50, 3))], axis=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.bin")
+            tree.save(path)
+            for mmap in [True, False]:
+                loaded = ArrayRangeTree.load(path, mmap=mmap)
+                self.assertEqual(loaded.points.tolist(), points.tolist())
+                self.assertEqual(loaded.batch_range_count(boxes).tolist(), tree.batch_range_count(boxes).tolist())
+                self.assertEqual(sorted(loaded.range_point_query((-3, 0, -10), (10, 12, 4))),
+                                 sorted(tree.range_point_query((-3, 0, -10), (10, 12, 4))))
+                del loaded
+            with open(path, "r+b") as f:
+                f.write(b"NOTATREE")
+            with self.assertRaises(ValueError):
+                ArrayRangeTree.load(path)
+
+    def test_parallel_build(self):
+        rng = np.random.RandomState(16)
+        for dimensions in [1, 2, 3]:
+            points = rng.randint(-50, 50, (500, dimensions))
+            serial = ArrayRangeTree.create_from_points(points)
+            parallel = ArrayRangeTree.create_from_points(points, workers=2)
+            self.assertEqual(serial._keys.keys(), parallel._keys.keys())
+            self.assertEqual(serial._ids.keys(), parallel._ids.keys())
+            for exponents, keys in serial._keys.items():
+                self.assertEqual(keys.tolist(), parallel._keys[exponents].tolist())
+            for exponents, ids in serial._ids.items():
+                self.assertEqual(ids.tolist(), parallel._ids[exponents].tolist())
+
+    def test_range_count(self):
+        rng = np.random.RandomState(5)
+        points = rng.randint(-10, 10, (200, 3))
+        tree = ArrayRangeTree.create_from_points(points)
+        for _ in range(50):
+            start = rng.randint(-11, 11, 3)
+            end = start + rng.randint(-1, 12, 3)
+            self.assertEqual(tree.range_count(start, end), len(tree.range_point_indices(start, end)))
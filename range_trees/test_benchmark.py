@@ -0,0 +1,49 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmark import compare, main
+
+
+def _run(build_seconds, p50, peak_memory_bytes=1000, engine="array"):
+    return {"results": [{
+        "engine": engine, "n": 1000, "dimensions": 2, "distribution": "uniform",
+        "build_seconds": build_seconds,
+        "peak_memory_bytes": peak_memory_bytes,
+        "queries": {"range_count": {"p50": p50}},
+    }]}
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_relative_threshold(self):
+        baseline = _run(1.0, 1e-3)
+        self.assertEqual(compare(baseline, _run(1.1, 1.1e-3), 0.2), [])
+        regressions = compare(baseline, _run(1.5, 1.1e-3), 0.2)
+        self.assertEqual(regressions, [(("array", 1000, 2, "uniform"), "build_seconds", 1.0, 1.5)])
+
+    def test_min_delta(self):
+        baseline = _run(1.0, 1e-6, peak_memory_bytes=1000)
+        current = _run(1.0, 3e-6, peak_memory_bytes=3000)
+        self.assertEqual({metric for _, metric, _, _ in compare(baseline, current, 0.2)},
+                         {"range_count.p50", "peak_memory_bytes"})
+        self.assertEqual(compare(baseline, current, 0.2, min_seconds=1e-5, min_bytes=64 * 1024), [])
+        current = _run(1.0, 3e-5, peak_memory_bytes=10 ** 6)
+        self.assertEqual({metric for _, metric, _, _ in compare(baseline, current, 0.2, 1e-5, 64 * 1024)},
+                         {"range_count.p50", "peak_memory_bytes"})
+
+    def test_missing_keys(self):
+        baseline = _run(1.0, 1e-3)
+        # Cases and metrics that only one of the runs has are not compared.
+        self.assertEqual(compare(baseline, _run(9.0, 9e-3, engine="kd"), 0.2), [])
+        del baseline["results"][0]["peak_memory_bytes"]
+        self.assertEqual(compare(baseline, _run(1.0, 1e-3, peak_memory_bytes=10 ** 9), 0.2), [])
+
+    def test_memory_budget_skips_cases(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            self.assertEqual(main(["--engines", "tree", "--sizes", "1000", "--dimensions", "3",
+                                   "--memory-budget", "1", "--output", output]), 0)
+            with open(output) as f:
+                self.assertEqual(json.load(f)["results"], [])
@@ -0,0 +1,106 @@
+import gc
+import random
+import threading
+import unittest
+
+from range_trees.builder import BudgetExceeded, BuildCancelled, TreeBuilder
+from range_trees.index import INDEXES, ArrayRangeTreeIndex, KDTreeIndex, RangeTreeIndex
+from range_trees.progress import BuildMonitor, collection_paused, current, monitor_build
+from range_trees.service import RangeTreeService
+
+
+class TestTreeBuilder(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.points = [(rng.randint(0, 50), rng.randint(0, 50), rng.randint(0, 50)) for _ in range(300)]
+
+    def test_estimates_match_builds(self):
+        for name, index in INDEXES.items():
+            monitor = BuildMonitor(name, 0, 3)
+            with monitor_build(monitor):
+                built = index.build(self.points)
+            self.assertIsNone(current())
+            estimate = index.estimate_entries(len(self.points), 3)
+            self.assertLessEqual(monitor.done, estimate, name)
+            self.assertGreater(monitor.done, estimate * 3 // 4, name)
+            self.assertEqual(built.count((10, 10, 10), (40, 40, 40)),
+                             sum(all(10 <= c <= 40 for c in point) for point in self.points))
+
+    def test_budget(self):
+        n = len(self.points)
+        budget = ArrayRangeTreeIndex.estimate_bytes(n, 3)
+        self.assertIs(TreeBuilder(RangeTreeIndex, memory_budget=budget).plan(n, 3).index, ArrayRangeTreeIndex)
+        self.assertIs(TreeBuilder("Regular", memory_budget=budget - 1).plan(n, 3).index, KDTreeIndex)
+        self.assertIs(TreeBuilder(memory_budget=budget).plan(n, 3).index, ArrayRangeTreeIndex)
+        with self.assertRaises(BudgetExceeded):
+            TreeBuilder(RangeTreeIndex, memory_budget=budget, fallback=False).plan(n, 3)
+        with self.assertRaises(BudgetExceeded):
+            TreeBuilder(RangeTreeIndex, memory_budget=KDTreeIndex.estimate_bytes(n, 3) - 1)(self.points)
+        self.assertIsInstance(TreeBuilder(RangeTreeIndex, memory_budget=budget)(self.points), ArrayRangeTreeIndex)
+
+    def test_progress(self):
+        for name in ["Regular", "Cascading", "Compact", "Array"]:
+            reports = []
+            builder = TreeBuilder(name, memory_budget=2 ** 40, callback=reports.append, interval=0)
+            self.assertIsNone(builder.progress)
+            builder(self.points)
+            self.assertEqual({progress.layer for progress in reports}, {0, 1, 2}, name)
+            fractions = [progress.fraction for progress in reports]
+            self.assertEqual(fractions, sorted(fractions))
+            self.assertTrue(all(fraction < 1 for fraction in fractions[:-1]))
+            self.assertTrue(reports[-1].finished)
+            self.assertIs(builder.progress, reports[-1])
+            self.assertIn(name, builder.progress.summary())
+
+    def test_cancel(self):
+        builder = TreeBuilder(RangeTreeIndex, memory_budget=2 ** 40)
+        builder.cancel()
+        with self.assertRaises(BuildCancelled):
+            builder(self.points)
+
+        def cancel_halfway(progress):
+            if progress.fraction > 0.5:
+                builder.cancel()
+
+        builder = TreeBuilder(RangeTreeIndex, memory_budget=2 ** 40, callback=cancel_halfway, interval=0)
+        with self.assertRaises(BuildCancelled):
+            builder(self.points)
+        self.assertFalse(builder.progress.finished)
+        self.assertIsNone(current())
+
+    def test_service_cancels_superseded_build(self):
+        started, release = threading.Event(), threading.Event()
+
+        def wait(progress):
+            started.set()
+            release.wait(5)
+
+        slow = TreeBuilder(RangeTreeIndex, memory_budget=2 ** 40, callback=wait)
+        with RangeTreeService(RangeTreeIndex.build([(0, 0, 0)])) as service:
+            superseded = service.rebuild(self.points, build=slow)
+            self.assertTrue(started.wait(5))
+            latest = service.rebuild(self.points[:10], build=TreeBuilder(KDTreeIndex, memory_budget=2 ** 40))
+            self.assertTrue(slow.cancelled)
+            release.set()
+            with self.assertRaises(BuildCancelled):
+                superseded.result(5)
+            self.assertEqual(latest.result(5), 2)
+            self.assertIsInstance(service.snapshot[0], KDTreeIndex)
+
+    def test_overlapping_builds_share_one_gc_pause(self):
+        self.assertTrue(gc.isenabled())
+        first, second = collection_paused(), collection_paused()
+        first.__enter__()
+        second.__enter__()
+        first.__exit__(None, None, None)
+        self.assertFalse(gc.isenabled())
+        second.__exit__(None, None, None)
+        self.assertTrue(gc.isenabled())
+        gc.disable()
+        try:
+            with collection_paused():
+                RangeTreeIndex.build(self.points)
+            self.assertFalse(gc.isenabled())
+        finally:
+            gc.enable()
@@ -0,0 +1,54 @@
+import random
+import unittest
+
+from range_trees.arraytree import ArrayRangeTree
+from range_trees.cache import QueryCache
+from range_trees.rangetree import TreeNode
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(2021)
+        self.points = [tuple(rng.randint(-10, 10) for _ in range(3)) for _ in range(200)]
+
+    def test_results_match_tree(self):
+        rng = random.Random(1)
+        for tree in [TreeNode.create_from_points(self.points), ArrayRangeTree.create_from_points(self.points)]:
+            cache = QueryCache()
+            for _ in range(60):
+                start = tuple(rng.randint(-11, 5) for _ in range(3))
+                end = tuple(s + rng.randint(0, 12) for s in start)
+                expected = sorted(tree.range_point_query(start, end))
+                self.assertEqual(sorted(map(tuple, cache.points(tree, start, end).tolist())), expected)
+                self.assertEqual(cache.count(tree, start, end), len(expected))
+            self.assertGreater(cache.stats.hits + cache.stats.containment_hits, 0)
+
+    def test_exact_and_containment_hits(self):
+        tree = TreeNode.create_from_points(self.points)
+        cache = QueryCache()
+        cache.points(tree, (-10, -10, -10), (10, 10, 10), version=1)
+        self.assertEqual(cache.stats.misses, 1)
+        cache.points(tree, (-10, -10, -10), (10, 10, 10), version=1)
+        self.assertEqual(cache.stats.hits, 1)
+        inner = cache.points(tree, (-2, -3, -4), (5, 6, 7), version=1)
+        count = cache.count(tree, (0, 0, 0), (3, 3, 3), version=1)
+        self.assertEqual(cache.stats.containment_hits, 2)
+        self.assertEqual(sorted(map(tuple, inner.tolist())), sorted(tree.range_point_query((-2, -3, -4), (5, 6, 7))))
+        self.assertEqual(count, tree.range_count((0, 0, 0), (3, 3, 3)))
+        self.assertFalse(inner.flags.writeable)
+        # A new version never reuses the old entries.
+        cache.count(tree, (0, 0, 0), (3, 3, 3), version=2)
+        self.assertEqual(cache.stats.misses, 2)
+
+    def test_lru_eviction(self):
+        tree = ArrayRangeTree.create_from_points(self.points)
+        full = tree.points[tree.range_point_indices((-10, -10, -10), (10, 10, 10))]
+        cache = QueryCache(max_bytes=full.nbytes + 100)
+        cache.points(tree, (-10, -10, -10), (10, 10, 10))
+        cache.count(tree, (-10, -10, -10), (-9, -9, -9))
+        cache.points(tree, (-10, -10, -10), (10, 10, 10))  # refresh, so the count is least recent
+        cache.count(tree, (0, 0, 0), (1, 1, 1))
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertLessEqual(cache.bytes, cache.max_bytes)
+        self.assertEqual(len(cache), 2)
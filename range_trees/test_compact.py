@@ -0,0 +1,35 @@
+import random
+import unittest
+
+from range_trees.compact import CompactInternal, CompactLeaf, CompactRangeTree
+from range_trees.rangetree import TreeNode
+
+
+class TestCompactRangeTree(unittest.TestCase):
+
+    def test_matches_tree_node(self):
+        rng = random.Random(6851)
+        for dimensions in [1, 2, 3]:
+            for num in [1, 2, 5, 33, 100]:
+                points = [tuple(rng.randint(-6, 6) for _ in range(dimensions)) for _ in range(num)]
+                tree = TreeNode.create_from_points(points)
+                compact = CompactRangeTree.create_from_points(points)
+                for _ in range(30):
+                    start = tuple(rng.randint(-7, 7) for _ in range(dimensions))
+                    end = tuple(s + rng.randint(0, 8) for s in start)
+                    expected = sorted(tree.range_point_query(start, end))
+                    self.assertEqual(compact.range_count(start, end), len(expected))
+                    self.assertEqual(sorted(compact.range_point_query(start, end)), expected)
+
+    def test_nodes_are_slotted(self):
+        compact = CompactRangeTree.create_from_points([(x, -x) for x in range(8)])
+        root = compact.root
+        self.assertIsInstance(root, CompactInternal)
+        self.assertFalse(hasattr(root, "__dict__"))
+        self.assertEqual(root.split, 3)
+        leaf = root.left.left.left
+        self.assertIsInstance(leaf, CompactLeaf)
+        self.assertFalse(hasattr(leaf, "__dict__"))
+        self.assertEqual((leaf.key, leaf.id), (0, 0))
+        self.assertIsNone(root.next.next)
+        self.assertEqual(root.next.split, -4)
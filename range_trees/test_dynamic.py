@@ -0,0 +1,115 @@
+import random
+import unittest
+from unittest import mock
+
+from range_trees import dynamic
+from range_trees.dynamic import ALPHA, DynamicRangeTree, VersionedRangeTree
+from range_trees.rangetree import Aggregate, TreeNode
+
+
+def _in_box(point, start, end):
+    return all(s <= c <= e for s, c, e in zip(start, point, end))
+
+
+class TestDynamicRangeTree(unittest.TestCase):
+
+    def assertBalanced(self, node: TreeNode):
+        for child in node.traverse_all():
+            if not child.is_leaf:
+                self.assertGreaterEqual(min(child.left.size, child.right.size), ALPHA * child.size)
+            if isinstance(child.value, TreeNode):
+                self.assertBalanced(child.value)
+
+    def test_insert_delete(self):
+        rng = random.Random(6851)
+        for dimensions in [1, 2, 3]:
+            tree = DynamicRangeTree(dimensions=dimensions, aggregates=[Aggregate.sum(0)])
+            points = []
+            for step in range(300):
+                if points and rng.random() < 0.3:
+                    point = points.pop(rng.randrange(len(points)))
+                    tree.delete(point)
+                else:
+                    point = tuple(rng.randint(-6, 6) for _ in range(dimensions))
+                    points.append(point)
+                    tree.insert(point)
+                self.assertEqual(len(tree), len(points))
+                if step % 25 == 0 and tree.root is not None:
+                    self.assertBalanced(tree.root)
+                start = tuple(rng.randint(-7, 7) for _ in range(dimensions))
+                end = tuple(s + rng.randint(0, 8) for s in start)
+                expected = [p for p in points if _in_box(p, start, end)]
+                self.assertEqual(sorted(tree.range_point_query(start, end)), sorted(expected))
+                self.assertEqual(tree.range_count(start, end), len(expected))
+                self.assertEqual(tree.range_aggregate(start, end, Aggregate.sum(0)), sum(p[0] for p in expected))
+
+    def test_delete_missing(self):
+        tree = DynamicRangeTree([(1, 2), (3, 4)])
+        with self.assertRaises(KeyError):
+            tree.delete((1, 3))
+        tree.delete((1, 2))
+        tree.delete((3, 4))
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(list(tree.range_point_query((0, 0), (5, 5))), [])
+        with self.assertRaises(KeyError):
+            tree.delete((3, 4))
+
+    def test_rebuilds_only_the_topmost_unbalanced_subtree(self):
+        tree = DynamicRangeTree([(x, -x) for x in range(8)])
+        rebuilt = []
+
+        def rebuild(points, index, dimensions, aggregates):
+            if index == 0:
+                rebuilt.append(len(points))
+            return TreeNode.create_from_points(points, index, dimensions=dimensions, aggregates=aggregates)
+
+        with mock.patch.object(dynamic, "_rebuild", rebuild):
+            # Appending keeps growing the rightmost path, so several of its nodes fall out of balance at once.
+            for x in range(8, 200):
+                del rebuilt[:]
+                tree.insert((x, -x))
+                self.assertLessEqual(len(rebuilt), 1)
+            for x in range(199, 20, -1):
+                del rebuilt[:]
+                tree.delete((x, -x))
+                self.assertLessEqual(len(rebuilt), 1)
+        self.assertBalanced(tree.root)
+        self.assertEqual(sorted(tree.range_point_query((0, -200), (200, 0))), [(x, -x) for x in range(21)])
+
+    def test_updates_do_not_modify_old_root(self):
+        tree = DynamicRangeTree([(x, x % 5) for x in range(20)])
+        old_root = tree.root
+        tree.insert((7, 7))
+        tree.delete((3, 3))
+        self.assertEqual(sorted(old_root.range_point_query((0, 0), (20, 20))), [(x, x % 5) for x in range(20)])
+
+
+class TestVersionedRangeTree(unittest.TestCase):
+
+    def test_as_of(self):
+        rng = random.Random(851)
+        tree = VersionedRangeTree([(0, 0, 0)])
+        history = [[(0, 0, 0)]]
+        for _ in range(120):
+            points = list(history[-1])
+            if len(points) > 1 and rng.random() < 0.3:
+                point = points.pop(rng.randrange(len(points)))
+                version = tree.delete(point)
+            else:
+                point = tuple(rng.randint(-5, 5) for _ in range(3))
+                points.append(point)
+                version = tree.insert(point)
+            history.append(points)
+            self.assertEqual(version, len(history) - 1)
+        for version, points in enumerate(history):
+            snapshot = tree.as_of(version)
+            self.assertEqual(len(snapshot), len(points))
+            self.assertEqual(sorted(snapshot.range_point_query((-2, -5, -3), (4, 5, 1))),
+                             sorted(p for p in points if _in_box(p, (-2, -5, -3), (4, 5, 1))))
+
+    def test_versions_share_subtrees(self):
+        tree = VersionedRangeTree([(x, -x) for x in range(64)])
+        tree.insert((100, 100))
+        old, new = tree.versions
+        self.assertIs(old.left, new.left)
+        self.assertIsNot(old.right, new.right)
@@ -0,0 +1,45 @@
+import unittest
+
+from range_trees.instrumentation import QueryStats, collect_stats, current
+from range_trees.rangetree import TreeNode
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.points = [(x, (7 * x) % 50, (13 * x) % 50) for x in range(50)]
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(current())
+        tree = TreeNode.create_from_points(self.points)
+        self.assertEqual(tree.range_count((0, 0, 0), (49, 49, 49)), 50)
+        self.assertIsNone(current())
+
+    def test_counts(self):
+        for cascade in [False, True]:
+            tree = TreeNode.create_from_points(self.points, cascade=cascade)
+            with collect_stats() as stats:
+                points = list(tree.range_point_query((10, 5, 0), (40, 45, 30)))
+            self.assertIsNone(current())
+            pieces = list(tree.canonical_nodes((10, 5, 0), (40, 45, 30)))
+            # Every layer's canonical nodes are counted once: the last layer's pieces, and the
+            # nodes above whose associated trees the query descends into.
+            self.assertEqual(stats.canonical_nodes, len(pieces) + stats.associated_descents)
+            self.assertEqual(stats.leaves_emitted, len(points))
+            self.assertEqual(len(stats.per_layer()), 2 if cascade else 3)
+            self.assertTrue(all(count > 0 for count in stats.per_layer()))
+            self.assertGreater(stats.canonical_nodes, 0)
+            self.assertGreater(stats.associated_descents, 0)
+            self.assertGreaterEqual(stats.phase_seconds["enumeration"], 0)
+            self.assertIn("canonical nodes", stats.summary())
+
+    def test_accumulates_into_given_stats(self):
+        tree = TreeNode.create_from_sorted_list(range(100))
+        stats = QueryStats()
+        for _ in range(2):
+            with collect_stats(stats):
+                list(tree.range_query(10, 60))
+        # [10, 60] splits into canonical subtrees of 1, 2, 4, 4, 8, 16 and 16 leaves.
+        self.assertEqual(stats.as_dict()["canonical_nodes"], 2 * 7)
+        self.assertEqual(list(stats.nodes_visited), [1])
+        self.assertGreater(stats.phase_seconds["descent"], 0)
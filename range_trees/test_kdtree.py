@@ -0,0 +1,77 @@
+import math
+import random
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from range_trees.index import INDEXES, KDTreeIndex, ArrayRangeTreeIndex, build_index, select_index
+from range_trees.kdtree import KDTree
+from range_trees.rangetree import TreeNode
+
+
+class TestKDTree(unittest.TestCase):
+
+    def test_matches_tree_node(self):
+        rng = random.Random(6851)
+        for dimensions in [1, 2, 3]:
+            for num in [1, 5, 33, 100]:
+                points = [tuple(rng.randint(-6, 6) for _ in range(dimensions)) for _ in range(num)]
+                tree = TreeNode.create_from_points(points)
+                kd_tree = KDTree.create_from_points(points, leaf_size=2)
+                boxes = []
+                for _ in range(30):
+                    start = tuple(rng.randint(-7, 7) for _ in range(dimensions))
+                    end = tuple(s + rng.randint(0, 8) for s in start)
+                    boxes.append((start, end))
+                    expected = sorted(tree.range_point_query(start, end))
+                    self.assertEqual(kd_tree.range_count(start, end), len(expected))
+                    self.assertEqual(sorted(kd_tree.range_point_query(start, end)), expected)
+                offsets, indices = kd_tree.batch_range_query(boxes)
+                for i, (start, end) in enumerate(boxes):
+                    self.assertEqual(sorted(indices[offsets[i]:offsets[i + 1]].tolist()),
+                                     sorted(kd_tree.range_point_indices(start, end).tolist()))
+                self.assertEqual(kd_tree.batch_range_count(boxes).tolist(), np.diff(offsets).tolist())
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    def test_engines_agree(self):
+        rng = random.Random(2021)
+        points = [tuple(rng.randint(-10, 10) for _ in range(3)) for _ in range(150)]
+        points += points[:40] + points[:10]
+        boxes = []
+        for _ in range(20):
+            start = tuple(rng.randint(-11, 5) for _ in range(3))
+            boxes.append((start, tuple(s + rng.randint(0, 12) for s in start)))
+        expected = None
+        for index in INDEXES.values():
+            built = index.build(points)
+            results = [(built.count(start, end), sorted(map(tuple, built.report(start, end).tolist())))
+                       for start, end in boxes]
+            self.assertEqual(built.batch(boxes).tolist(), [count for count, _ in results])
+            for (_, old), (_, new), (old_start, old_end), (new_start, new_end) in zip(results, results[1:], boxes,
+                                                                                   boxes[1:]):
+                entered, left = built.diff(old_start, old_end, new_start, new_end)
+                old, new = Counter(old), Counter(new)
+                self.assertEqual((sorted(map(tuple, entered)), sorted(map(tuple, left))),
+                                 (sorted((new - old).elements()), sorted((old - new).elements())), index.name)
+            # An empty old box, as the app sends first, and a box disjoint from the new one.
+            empty = (math.inf,) * 3, (-math.inf,) * 3
+            disjoint = (20, 20, 20), (30, 30, 30)
+            fullest = max(range(len(boxes)), key=lambda i: results[i][0])
+            self.assertGreater(results[fullest][0], 0)
+            for old_box in [empty, disjoint]:
+                entered, left = built.diff(*old_box, *boxes[fullest])
+                self.assertEqual((sorted(map(tuple, entered)), left), (results[fullest][1], []), index.name)
+                entered, left = built.diff(*boxes[fullest], *old_box)
+                self.assertEqual((entered, sorted(map(tuple, left))), ([], results[fullest][1]), index.name)
+            if expected is None:
+                expected = results
+            self.assertEqual(results, expected, index.name)
+
+    def test_select_index(self):
+        self.assertIs(select_index(1000, 3, memory_budget=2 ** 30), ArrayRangeTreeIndex)
+        self.assertIs(select_index(10 ** 7, 3, memory_budget=2 ** 30), KDTreeIndex)
+        self.assertIs(select_index(10 ** 9, 3, memory_budget=1), KDTreeIndex)
+        self.assertIsInstance(build_index([(0, 1), (2, 3)]), ArrayRangeTreeIndex)
@@ -0,0 +1,64 @@
+import random
+import unittest
+
+from range_trees.arraytree import ArrayRangeTree
+from range_trees.compact import CompactRangeTree
+from range_trees.index import KDTreeIndex
+from range_trees.kdtree import KDTree
+from range_trees.paging import RangePager
+from range_trees.rangetree import TreeNode
+
+
+class TestRangePager(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(12)
+        self.points = [tuple(rng.randint(-10, 10) for _ in range(3)) for _ in range(300)]
+        self.start, self.end = (-6, -8, -10), (8, 7, 9)
+        self.trees = [TreeNode.create_from_points(self.points),
+                      TreeNode.create_from_points(self.points, cascade=True),
+                      CompactRangeTree.create_from_points(self.points),
+                      ArrayRangeTree.create_from_points(self.points),
+                      KDTree.create_from_points(self.points, leaf_size=4)]
+
+    def test_chunks_cover_result_in_order(self):
+        for tree in self.trees:
+            expected = list(tree.range_point_query(self.start, self.end))
+            pager = RangePager(tree, self.start, self.end)
+            self.assertEqual(pager.total, len(expected))
+            chunks = list(pager.chunks(chunk_size=7))
+            self.assertTrue(all(len(chunk) == 7 for chunk, _ in chunks[:-1]))
+            self.assertEqual([tuple(row) for chunk, _ in chunks for row in chunk.tolist()], expected)
+
+    def test_resume_from_cursor(self):
+        for tree in self.trees:
+            expected = list(tree.range_point_query(self.start, self.end))
+            pager = RangePager(tree, self.start, self.end)
+            _, cursor = next(pager.chunks(chunk_size=10))
+            # A fresh pager for the same box resumes where the first one stopped.
+            rest = [tuple(row) for chunk, _ in RangePager(tree, self.start, self.end).chunks(25, cursor)
+                    for row in chunk.tolist()]
+            self.assertEqual(rest, expected[10:])
+
+    def test_page(self):
+        for tree in self.trees:
+            expected = list(tree.range_point_query(self.start, self.end))
+            pager = RangePager(tree, self.start, self.end)
+            for offset in [0, 1, 13, len(expected) - 3]:
+                self.assertEqual([tuple(row) for row in pager.page(offset, 9).tolist()], expected[offset:offset + 9])
+            self.assertEqual(len(pager.page(len(expected), 9)), 0)
+
+    def test_sample(self):
+        for tree in self.trees:
+            pager = RangePager(tree, self.start, self.end)
+            expected = [tuple(row) for chunk, _ in pager.chunks() for row in chunk.tolist()]
+            sample = [tuple(row) for row in pager.sample(10).tolist()]
+            self.assertEqual(sample, [expected[i * len(expected) // 10] for i in range(10)])
+            self.assertEqual(sorted(map(tuple, pager.sample(len(expected) + 5).tolist())), sorted(expected))
+        index = KDTreeIndex.build(self.points)
+        self.assertEqual(RangePager(index, self.start, self.end).total, index.count(self.start, self.end))
+
+    def test_malformed_cursor(self):
+        pager = RangePager(self.trees[0], self.start, self.end)
+        with self.assertRaises(ValueError):
+            next(pager.chunks(cursor="not a cursor"))
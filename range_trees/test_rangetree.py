@@ -1,5 +1,9 @@
 import unittest
-from rangetree import TreeNode
+import operator
+import random
+from unittest import mock
+from range_trees import rangetree
+from range_trees.rangetree import Aggregate, TreeNode
 
 
 class TestRangeTree(unittest.TestCase):
@@ -29,3 +33,134 @@ class TestRangeTree(unittest.TestCase):
                     all_keys = [d.key for st in top_nodes for d in st.traverse_leaves()]
                     self.assertEqual(expected_count, actual_count)
                     self.assertEqual(all_keys, [key for key in tree_range if start <= key <= end])
+
+    def test_range_point_query(self):
+        rng = random.Random(851)
+        for dimensions in [1, 2, 3]:
+            points = [tuple(rng.randint(-8, 8) for _ in range(dimensions)) for _ in range(60)]
+            tree = TreeNode.create_from_points(points)
+            for _ in range(40):
+                start = tuple(rng.randint(-9, 9) for _ in range(dimensions))
+                end = tuple(s + rng.randint(0, 10) for s in start)
+                expected = [p for p in points if all(s <= c <= e for s, c, e in zip(start, p, end))]
+                self.assertEqual(sorted(tree.range_point_query(start, end)), sorted(expected))
+
+    def test_cascade_matches_range_point_query(self):
+        rng = random.Random(6851)
+        for dimensions in [2, 3]:
+            for num in [1, 2, 9, 64, 101]:
+                points = [tuple(rng.randint(-8, 8) for _ in range(dimensions)) for _ in range(num)]
+                tree = TreeNode.create_from_points(points)
+                cascaded = TreeNode.create_from_points(points, cascade=True)
+                for _ in range(40):
+                    start = tuple(rng.randint(-9, 9) for _ in range(dimensions))
+                    end = tuple(s + rng.randint(0, 10) for s in start)
+                    self.assertEqual(sorted(cascaded.range_point_query(start, end)),
+                                     sorted(tree.range_point_query(start, end)))
+
+    def test_range_count(self):
+        rng = random.Random(17)
+        for dimensions in [1, 2, 3]:
+            points = [tuple(rng.randint(-8, 8) for _ in range(dimensions)) for _ in range(80)]
+            trees = [TreeNode.create_from_points(points), TreeNode.create_from_points(points, cascade=True)]
+            for _ in range(40):
+                start = tuple(rng.randint(-9, 9) for _ in range(dimensions))
+                end = tuple(s + rng.randint(0, 10) for s in start)
+                expected = len([p for p in points if all(s <= c <= e for s, c, e in zip(start, p, end))])
+                for tree in trees:
+                    self.assertEqual(tree.range_count(start, end), expected)
+
+    def test_range_diff(self):
+        rng = random.Random(31)
+        for dimensions in [1, 2, 3]:
+            # A trailing id column makes every point distinct.
+            points = [tuple(rng.randint(-8, 8) for _ in range(dimensions)) + (i,) for i in range(70)]
+            trees = [TreeNode.create_from_points(points, dimensions=dimensions)]
+            if dimensions > 1:
+                trees.append(TreeNode.create_from_points(points, dimensions=dimensions, cascade=True))
+
+            def inside(start, end):
+                return {p for p in points if all(s <= c <= e for s, c, e in zip(start, p, end))}
+            for _ in range(40):
+                old_start = tuple(rng.randint(-9, 9) for _ in range(dimensions))
+                old_end = tuple(s + rng.randint(0, 10) for s in old_start)
+                new_start = tuple(s + rng.randint(-2, 2) for s in old_start)
+                new_end = tuple(e + rng.randint(-2, 2) for e in old_end)
+                old, new = inside(old_start, old_end), inside(new_start, new_end)
+                for tree in trees:
+                    entered, left = tree.range_diff(old_start, old_end, new_start, new_end)
+                    self.assertEqual(sorted(entered), sorted(new - old))
+                    self.assertEqual(sorted(left), sorted(old - new))
+                    self.assertEqual(tree.range_diff(old_start, old_end, old_start, old_end), ([], []))
+
+    def test_range_aggregate(self):
+        rng = random.Random(23)
+        aggregates = [Aggregate.sum(2), Aggregate.min(2), Aggregate.max(2)]
+        points = [(rng.randint(-8, 8), rng.randint(-8, 8), rng.random()) for _ in range(80)]
+        for cascade in [False, True]:
+            tree = TreeNode.create_from_points(points, dimensions=2, cascade=cascade, aggregates=aggregates)
+            for _ in range(40):
+                start = (rng.randint(-9, 9), rng.randint(-9, 9))
+                end = (start[0] + rng.randint(0, 10), start[1] + rng.randint(0, 10))
+                values = [p[2] for p in points if start[0] <= p[0] <= end[0] and start[1] <= p[1] <= end[1]]
+                self.assertAlmostEqual(tree.range_aggregate(start, end, Aggregate.sum(2)), sum(values))
+                self.assertEqual(tree.range_aggregate(start, end, Aggregate.min(2)), min(values, default=float("inf")))
+                self.assertEqual(tree.range_aggregate(start, end, Aggregate.max(2)), max(values, default=-float("inf")))
+        with self.assertRaises(ValueError):
+            TreeNode.create_from_points(points, dimensions=2).range_aggregate((-9, -9), (9, 9), Aggregate.sum(2))
+        with self.assertRaises(ValueError):
+            TreeNode.create_from_points(points, dimensions=2, cascade=True).range_aggregate((-9, -9), (9, 9),
+                                                                                          Aggregate.sum(2))
+        with self.assertRaises(ValueError):
+            TreeNode.create_from_points(points, dimensions=2, cascade=True, aggregates=[Aggregate(2, operator.mul, 1)])
+
+    def test_range_top_k(self):
+        rng = random.Random(29)
+        by_weight, by_last = Aggregate.max_point(2), Aggregate.min_point(1)
+        points = [(rng.randint(-8, 8), rng.randint(-8, 8), rng.random()) for _ in range(90)]
+        for cascade in [False, True]:
+            tree = TreeNode.create_from_points(points, dimensions=2, cascade=cascade, aggregates=[by_weight, by_last])
+            for _ in range(40):
+                start = (rng.randint(-9, 9), rng.randint(-9, 9))
+                end = (start[0] + rng.randint(0, 10), start[1] + rng.randint(0, 10))
+                inside = [p for p in points if start[0] <= p[0] <= end[0] and start[1] <= p[1] <= end[1]]
+                for k in [0, 1, 5, 100]:
+                    self.assertEqual(tree.range_top_k(start, end, k, by_weight),
+                                     sorted(inside, key=lambda p: -p[2])[:k])
+                    self.assertEqual([p[1] for p in tree.range_top_k(start, end, k, by_last)],
+                                     sorted(p[1] for p in inside)[:k])
+                self.assertEqual(tree.range_aggregate(start, end, by_weight), max(inside, key=lambda p: p[2], default=None))
+        with self.assertRaises(ValueError):
+            TreeNode.create_from_points(points, dimensions=2).range_top_k((-9, -9), (9, 9), 3, by_weight)
+
+    def test_range_top_k_heap_size(self):
+        by_weight = Aggregate.max_point(2)
+        points = [(x % 50, x // 50, (x * 7919) % 2500) for x in range(2500)]
+        start, end, k = (3, 4), (45, 40), 5
+        inside = [p for p in points if 3 <= p[0] <= 45 and 4 <= p[1] <= 40]
+        original = rangetree._Candidate.__init__
+        for cascade in [False, True]:
+            tree = TreeNode.create_from_points(points, dimensions=2, cascade=cascade, aggregates=[by_weight])
+            pushed = []
+
+            def counting(candidate, *args):
+                pushed.append(args)
+                original(candidate, *args)
+
+            with mock.patch.object(rangetree._Candidate, "__init__", counting):
+                self.assertEqual(tree.range_top_k(start, end, k, by_weight), sorted(inside, key=lambda p: -p[2])[:k])
+            # Each canonical node enters once. A cascade slice splits in two around each point it
+            # reports; a tree node is split down to a leaf, at most log n levels, per point.
+            canonical = len(list(tree.canonical_nodes(start, end)))
+            splits = 1 if cascade else len(points).bit_length()
+            self.assertLessEqual(len(pushed), canonical + 2 * k * splits, cascade)
+            self.assertLess(len(pushed), len(inside) // 10)
+
+    def test_create_from_points_is_balanced(self):
+        points = [(x, -x) for x in range(37)]
+        tree = TreeNode.create_from_points(points)
+        for node in tree.traverse_all():
+            if not node.is_leaf:
+                self.assertLessEqual(abs(node.left.size - node.right.size), 1)
+                self.assertEqual([leaf.key.point for leaf in node.value.traverse_leaves()],
+                                 sorted((leaf.key.point for leaf in node.traverse_leaves()), key=lambda p: p[1]))
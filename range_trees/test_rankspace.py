@@ -0,0 +1,70 @@
+import random
+import unittest
+from datetime import date, timedelta
+
+from range_trees.arraytree import ArrayRangeTree
+from range_trees.rangetree import PointIndex, TreeNode
+from range_trees.rankspace import RankSpaceTree
+
+
+class TestRankSpaceTree(unittest.TestCase):
+
+    def test_matches_brute_force_with_duplicates(self):
+        rng = random.Random(6851)
+        for dimensions in [1, 2, 3]:
+            # Few distinct values, so most coordinates are shared by many points.
+            points = [tuple(rng.choice([-1.5, 0.0, 0.25, 2.0]) for _ in range(dimensions)) for _ in range(120)]
+            trees = [RankSpaceTree.create_from_points(points),
+                     RankSpaceTree.create_from_points(points, engine=ArrayRangeTree)]
+            if dimensions > 1:
+                trees.append(RankSpaceTree.create_from_points(points, cascade=True))
+            for _ in range(30):
+                start = tuple(rng.uniform(-2, 2) for _ in range(dimensions))
+                end = tuple(s + rng.uniform(-0.5, 3) for s in start)
+                expected = sorted(p for p in points if all(s <= c <= e for s, c, e in zip(start, p, end)))
+                for tree in trees:
+                    self.assertEqual(tree.range_count(start, end), len(expected))
+                    self.assertEqual(sorted(tree.range_point_query(start, end)), expected)
+
+    def test_ordered_coordinate_types(self):
+        day = date(2021, 5, 1)
+        points = [(day + timedelta(days=i % 7), "abcdefg"[i % 5], i) for i in range(40)]
+        tree = RankSpaceTree.create_from_points(points, dimensions=2)
+        start, end = (day + timedelta(days=2), "b"), (day + timedelta(days=4), "c")
+        expected = [p for p in points if start[0] <= p[0] <= end[0] and start[1] <= p[1] <= end[1]]
+        self.assertEqual(sorted(tree.range_point_query(start, end)), sorted(expected))
+        self.assertEqual(tree.range_count((day, "z"), (day, "zz")), 0)
+
+    def test_ranks_are_distinct(self):
+        tree = RankSpaceTree.create_from_points([(1, 1)] * 8)
+        self.assertEqual(sorted(leaf.key.point[0] for leaf in tree.tree.traverse_leaves()), list(range(8)))
+        self.assertEqual(tree.rank_box((1, 1), (1, 1)), ((0, 0), (7, 7)))
+
+
+class TestCompositeKeys(unittest.TestCase):
+
+    def test_search_finds_every_duplicate(self):
+        rng = random.Random(3)
+        points = [(rng.randint(0, 3), rng.randint(0, 50)) for _ in range(100)]
+        tree = TreeNode.create_from_points(points)
+        for point in points:
+            found = tree.search(PointIndex(point, 0))
+            self.assertIsNotNone(found)
+            self.assertEqual(found.key.point, point)
+        self.assertLess(PointIndex((1, 2), 0), PointIndex((1, 3), 0))
+        self.assertLess(PointIndex((1, 2), 0, id=0), PointIndex((1, 2), 0, id=1))
+        self.assertEqual(PointIndex((1, 2), 0), 1)
+
+    def test_payload_is_never_compared(self):
+        payloads = [{"name": "a"}, None, 3, {"name": "b"}]
+        points = [(1, 2, payload) for payload in payloads] + [(0, 5, None), (1, 1, 7)]
+        tree = TreeNode.create_from_points(points, dimensions=2)
+        leaves = list(tree.traverse_leaves())
+        self.assertEqual([leaf.key.id for leaf in leaves], [4, 5, 0, 1, 2, 3])
+        self.assertEqual(len({leaf.key.id for leaf in leaves}), len(points))
+        self.assertNotEqual(leaves[2].key, leaves[3].key)
+        self.assertLess(leaves[2].key, leaves[3].key)
+        self.assertEqual(PointIndex((1, 2, None), 0, dimensions=2), leaves[3].key)
+        self.assertCountEqual(tree.range_point_query((1, 2), (1, 2)), points[:4])
+        found = tree.search(PointIndex((1, 2, 3), 0, dimensions=2))
+        self.assertEqual(found.key.point[:2], (1, 2))
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import unittest
+
+from range_trees.cache import QueryCache
+from range_trees.index import KDTreeIndex
+from range_trees.rangetree import TreeNode
+from range_trees.service import RangeTreeService
+
+
+class TestRangeTreeService(unittest.TestCase):
+
+    def test_rebuild_swaps_tree(self):
+        with RangeTreeService(TreeNode.create_from_points([(0, 0)]), cache=QueryCache()) as service:
+            self.assertEqual(service.count((-1, -1), (1, 1)).result(5), 1)
+            version = service.rebuild([(x, x) for x in range(10)]).result(5)
+            self.assertEqual(version, 1)
+            self.assertEqual(service.snapshot[1], 1)
+            self.assertEqual(service.count((-1, -1), (4, 4)).result(5), 5)
+            self.assertEqual(sorted(map(tuple, service.points((2, 2), (3, 3)).result(5).tolist())), [(2, 2), (3, 3)])
+
+    def test_rebuild_with_other_engine(self):
+        with RangeTreeService(TreeNode.create_from_points([(0, 0)])) as service:
+            service.rebuild([(x, x) for x in range(10)], build=KDTreeIndex.build).result(5)
+            self.assertIsInstance(service.snapshot[0], KDTreeIndex)
+            self.assertEqual(service.count((-1, -1), (4, 4)).result(5), 5)
+            self.assertEqual(service.points((20, 20), (30, 30)).result(5).shape, (0, 2))
+
+    def test_queries_use_old_tree_during_build(self):
+        release = threading.Event()
+
+        def slow_build(points):
+            release.wait(5)
+            return TreeNode.create_from_points(points)
+
+        with RangeTreeService(TreeNode.create_from_points([(0, 0)]), build=slow_build) as service:
+            build = service.rebuild([(x, x) for x in range(10)])
+            self.assertTrue(service.building)
+            self.assertEqual(service.count((-10, -10), (10, 10)).result(5), 1)
+            superseded = service.rebuild([(1, 1)])
+            newest = service.rebuild([(2, 2), (3, 3)])
+            self.assertTrue(superseded.cancelled())
+            release.set()
+            self.assertEqual(build.result(5), 1)
+            self.assertEqual(newest.result(5), 3)
+            self.assertEqual(service.count((-10, -10), (10, 10)).result(5), 2)
+
+    def test_async(self):
+        blocker = threading.Event()
+        with RangeTreeService(TreeNode.create_from_points([(0, 0), (1, 1)]), query_workers=1) as service:
+            async def run():
+                self.assertEqual(await service.count_async((0, 0), (1, 1), timeout=5), 2)
+                service.submit(lambda tree, version: blocker.wait(5))
+                with self.assertRaises(asyncio.TimeoutError):
+                    await service.count_async((0, 0), (1, 1), timeout=0.05)
+                blocker.set()
+            asyncio.run(run())